@@ -1,11 +1,19 @@
+import asyncio
 import logging
 import os
+from collections import defaultdict
+from string import Template
+import orjson
 from fastapi import Request, Response
-from codegen import CodeAgent, CodegenApp
+from fastapi.responses import ORJSONResponse
+from codegen import CodeAgent, CodegenApp, Codebase
 from codegen.extensions.github.types.events.pull_request import PullRequestLabeledEvent, PullRequestOpenedEvent
 from codegen.extensions.slack.types import SlackEvent
 from codegen.extensions.tools.github.create_pr_comment import create_pr_comment
 
+from shared_codebase import SharedCodebase
+from slack_filters import extract_challenge, forget_event_on_error, is_dm, is_duplicate_event
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,30 +25,182 @@ logger = logging.getLogger(__name__)
 # Create the cg_app
 cg = CodegenApp(name="code", repo="zeeeepa/cod")
 
+# Serialize handler return values with orjson instead of the stdlib encoder
+cg.app.router.default_response_class = ORJSONResponse
+
+# Parsing the repository is the expensive part of every handler, so do it once and reuse the result
+_codebase_lock = asyncio.Lock()
+
+async def get_cached_codebase() -> Codebase:
+    """Get the shared codebase, parsing the repository on first use."""
+    if cg.codebase is None:
+        async with _codebase_lock:
+            if cg.codebase is None:
+                logger.info("[CODEBASE] Parsing repository")
+                await asyncio.to_thread(cg.parse_repo)
+    return cg.get_codebase()
+
+# Agents run on the shared codebase, pinned to the default branch while they run;
+# PR handlers read PR heads from a second clone, so agents never see a PR checkout
+codebases = SharedCodebase(cg.get_codebase, cg.repo, os.path.join(cg.tmp_dir, "pr-heads"))
+
+# codebase.files and codebase.functions build full lists, so counts are cached for the commit they were taken at
+_counts_commit: str | None = None
+_counts: tuple[int, int] = (0, 0)
+
+def get_codebase_counts(codebase: Codebase) -> tuple[int, int]:
+    """Get the number of files and functions in the codebase, recounting only after a checkout."""
+    global _counts_commit, _counts
+    commit = codebase.current_commit
+    sha = commit.hexsha if commit else None
+    if sha is None or sha != _counts_commit:
+        _counts = (len(codebase.files), len(codebase.functions))
+        _counts_commit = sha
+    return _counts
+
+# Cap concurrent agent runs to stay under the LLM provider's rate limits
+_agent_sem = asyncio.Semaphore(int(os.environ.get("AGENT_MAX_CONCURRENCY", "8")))
+
+# CodeAgent keeps per-run state, so each run checks an agent out of this pool; it never grows past the semaphore size.
+# Pooled agents serve different Slack users, so they are built without conversation memory.
+_idle_agents: list[CodeAgent] = []
+
+async def create_agent() -> CodeAgent:
+    """Build a memoryless code agent on the shared codebase."""
+    logger.info("[CODE_AGENT] Initializing code agent")
+    codebase = await get_cached_codebase()
+    return CodeAgent(codebase=codebase, memory=False)
+
+def run_on_default_branch(agent: CodeAgent, prompt: str) -> str:
+    """Run an agent while holding the shared codebase on the default branch."""
+    with codebases.default_branch():
+        return agent.run(prompt)
+
+async def run_agent(prompt: str) -> str:
+    """Run an idle code agent in a worker thread so the event loop stays free."""
+    async with _agent_sem:
+        agent = _idle_agents.pop() if _idle_agents else await create_agent()
+        try:
+            return await asyncio.to_thread(run_on_default_branch, agent, prompt)
+        finally:
+            _idle_agents.append(agent)
+
+class PromptQueue:
+    """Coalesce bursts of Slack prompts into batches of agent runs.
+
+    A prompt that arrives on an idle queue runs immediately. When prompts are already waiting,
+    up to ``max_batch`` of them arriving within ``window`` seconds are drained together; prompts
+    from the same channel run in order so replies are posted in order, while different channels
+    run concurrently.
+    """
+
+    def __init__(self, max_batch: int = 8, window: float = 0.2):
+        self.max_batch = max_batch
+        self.window = window
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Start draining the queue on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._drain())
+
+    async def submit(self, channel: str, prompt: str) -> str:
+        """Queue a prompt and wait for the agent's response."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((channel, prompt, future))
+        return await future
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+
+            # Only wait for more prompts when a burst is already queued up
+            if not self._queue.empty():
+                deadline = loop.time() + self.window
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+            by_channel = defaultdict(list)
+            for channel, prompt, future in batch:
+                by_channel[channel].append((prompt, future))
+            await asyncio.gather(*(self._run_in_order(items) for items in by_channel.values()))
+
+    async def _run_in_order(self, items: list[tuple[str, asyncio.Future]]):
+        for prompt, future in items:
+            try:
+                future.set_result(await run_agent(prompt))
+            except Exception as e:
+                future.set_exception(e)
+
+prompt_queue = PromptQueue()
+
+@cg.app.on_event("startup")
+async def warm_up():
+    """Parse the repository and build the code agent at startup so the first webhook doesn't pay for it."""
+    await get_cached_codebase()
+    if not _idle_agents:
+        _idle_agents.append(await create_agent())
+    prompt_queue.start()
+
+@cg.app.post("/warmup")
+async def warmup():
+    """Run a trivial prompt through the agent, e.g. right after a deploy."""
+    await run_agent("ping")
+    return {"message": "Agent warmed up"}
+
 # Add explicit route handlers for webhooks
 @cg.app.post("/slack/events")
 async def slack_webhook(request: Request):
     """Handle Slack webhook events, including URL verification."""
     logger.info("[SLACK] Received webhook request")
     
-    # Get the request body
-    body = await request.json()
-    logger.info(f"[SLACK] Request body: {body}")
+    # Read the request body once
+    raw = await request.body()
     
     # Handle Slack URL verification challenge
-    if body.get("type") == "url_verification":
+    challenge = extract_challenge(raw)
+    if challenge is not None:
         logger.info("[SLACK] Handling URL verification challenge")
-        challenge = body.get("challenge")
         return {"challenge": challenge}
     
-    # Process the event through the normal event handlers
-    return await cg.slack.handle_webhook(request)
+    body = orjson.loads(raw)
+    # Formatting the whole payload is costly and it can hold message text, so only do it when debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[SLACK] Request body: %s", body)
+    
+    # Slack redelivers events it thinks timed out; answer those without running the handler again
+    if is_duplicate_event(request, body):
+        return {"message": "Duplicate event, ignoring"}
+    
+    # Keep the DM allowlist current
+    event = body.get("event") or {}
+    if event.get("type") == "im_created":
+        _dm_channels.add(event["channel"]["id"])
+    elif event.get("type") == "channel_deleted":
+        _dm_channels.discard(event["channel"])
+    
+    # Dispatch the already-parsed payload instead of having the handler re-read the request
+    with forget_event_on_error(body):
+        return await cg.slack.handle(body)
 
 @cg.app.post("/github/events")
 async def github_webhook(request: Request):
     """Handle GitHub webhook events."""
     logger.info("[GITHUB] Received webhook request")
-    return await cg.github.handle_webhook(request)
+    result = await cg.github.handle_webhook(request)
+    # PR handlers are async, so await the coroutine they hand back
+    if hasattr(result, "__await__"):
+        result = await result
+    return result
 
 @cg.slack.event("app_mention")
 async def handle_mention(event: SlackEvent):
@@ -48,99 +208,109 @@ async def handle_mention(event: SlackEvent):
     logger.info("[APP_MENTION] Received app_mention event")
     logger.info(event)
 
-    # Codebase
-    logger.info("[CODEBASE] Initializing codebase")
-    codebase = cg.get_codebase()
-
-    # Code Agent
-    logger.info("[CODE_AGENT] Initializing code agent")
-    agent = CodeAgent(codebase=codebase)
-
     logger.info("[CODE_AGENT] Running code agent")
-    response = agent.run(event.text)
+    response = await prompt_queue.submit(event.channel, event.text)
 
-    # Send response back to Slack
-    cg.slack.client.chat_postMessage(channel=event.channel, text=response, thread_ts=event.ts)
+    # Send response back to Slack (a blocking HTTP call, so keep it off the event loop)
+    await asyncio.to_thread(cg.slack.client.chat_postMessage, channel=event.channel, text=response, thread_ts=event.ts)
     
     # Return response for logging
     return {"message": "Mentioned", "received_text": event.text, "response": response}
 
+# Slack notification templates for PR events
+PR_LABELED_MESSAGE = Template(
+    "*PR #$pr_number labeled with `$label`*\n"
+    "*Repository:* $repo_name\n"
+    "*Title:* $pr_title\n"
+    "*URL:* $pr_url"
+)
+
+PR_OPENED_MESSAGE = Template(
+    "*New PR #$pr_number opened*\n"
+    "*Repository:* $repo_name\n"
+    "*Title:* $pr_title\n"
+    "*URL:* $pr_url\n\n"
+    "*Description:*\n$pr_body"
+)
+
+def read_pr_head(sha: str) -> tuple[str, int, int]:
+    """Check out a PR head and return its README and its file and function counts."""
+    with codebases.at_commit(sha) as codebase:
+        # Get README file
+        logger.info("> Getting README file")
+        readme = codebase.get_file("README.md").content
+        return (readme, *get_codebase_counts(codebase))
+
 @cg.github.event("pull_request:labeled")
-def handle_pr_labeled(event: PullRequestLabeledEvent):
+async def handle_pr_labeled(event: PullRequestLabeledEvent):
     """Handle PR labeled events and post a comment with README content."""
     logger.info("[PR_LABELED] PR labeled")
     logger.info(f"PR head sha: {event.pull_request.head.sha}")
     
-    # Get codebase
-    codebase = cg.get_codebase()
-
-    # Checkout commit
+    # Checkout commit (git I/O, so keep it off the event loop)
     logger.info("> Checking out commit")
-    codebase.checkout(commit=event.pull_request.head.sha)
+    readme, num_files, num_functions = await asyncio.to_thread(read_pr_head, event.pull_request.head.sha)
 
-    # Get README file
-    logger.info("> Getting README file")
-    file = codebase.get_file("README.md")
+    # Get codebase
+    codebase = await get_cached_codebase()
 
     # Create PR comment
-    create_pr_comment(codebase, event.pull_request.number, f"File content:\n```markdown\n{file.content}\n```")
+    comment = "".join(["File content:\n```markdown\n", readme, "\n```"])
+    tasks = [asyncio.to_thread(create_pr_comment, codebase, event.pull_request.number, comment)]
 
     # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set
     slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
     if slack_channel:
         logger.info(f"> Notifying Slack channel {slack_channel}")
-        repo_name = event.repository.full_name
-        pr_number = event.pull_request.number
-        pr_title = event.pull_request.title
-        pr_url = event.pull_request.html_url
-        label = event.label.name
-        
-        message = (
-            f"*PR #{pr_number} labeled with `{label}`*\n"
-            f"*Repository:* {repo_name}\n"
-            f"*Title:* {pr_title}\n"
-            f"*URL:* {pr_url}"
+        message = PR_LABELED_MESSAGE.substitute(
+            pr_number=event.pull_request.number,
+            label=event.label.name,
+            repo_name=event.repository.full_name,
+            pr_title=event.pull_request.title,
+            pr_url=event.pull_request.html_url,
         )
         
-        cg.slack.client.chat_postMessage(channel=slack_channel, text=message)
+        tasks.append(asyncio.to_thread(cg.slack.client.chat_postMessage, channel=slack_channel, text=message))
+
+    # PR comment and Slack notification are independent, so send them concurrently
+    await asyncio.gather(*tasks)
 
     return {
         "message": "PR labeled event handled", 
-        "num_files": len(codebase.files), 
-        "num_functions": len(codebase.functions)
+        "num_files": num_files, 
+        "num_functions": num_functions
     }
 
 @cg.github.event("pull_request:opened")
-def handle_pr_opened(event: PullRequestOpenedEvent):
+async def handle_pr_opened(event: PullRequestOpenedEvent):
     """Handle PR opened events and notify Slack."""
     logger.info("[PR_OPENED] PR opened")
     
     # Get codebase
-    codebase = cg.get_codebase()
+    codebase = await get_cached_codebase()
+
+    tasks = []
 
     # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set
     slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
     if slack_channel:
         logger.info(f"> Notifying Slack channel {slack_channel}")
-        repo_name = event.repository.full_name
-        pr_number = event.pull_request.number
-        pr_title = event.pull_request.title
-        pr_url = event.pull_request.html_url
-        pr_body = event.pull_request.body or "No description provided"
-        
-        message = (
-            f"*New PR #{pr_number} opened*\n"
-            f"*Repository:* {repo_name}\n"
-            f"*Title:* {pr_title}\n"
-            f"*URL:* {pr_url}\n\n"
-            f"*Description:*\n{pr_body}"
+        message = PR_OPENED_MESSAGE.substitute(
+            pr_number=event.pull_request.number,
+            repo_name=event.repository.full_name,
+            pr_title=event.pull_request.title,
+            pr_url=event.pull_request.html_url,
+            pr_body=event.pull_request.body or "No description provided",
         )
         
-        cg.slack.client.chat_postMessage(channel=slack_channel, text=message)
+        tasks.append(asyncio.to_thread(cg.slack.client.chat_postMessage, channel=slack_channel, text=message))
 
     # Add a welcome comment to the PR
     welcome_message = "Thanks for opening this PR! 🎉\n\nI'll analyze your changes and provide feedback shortly."
-    create_pr_comment(codebase, event.pull_request.number, welcome_message)
+    tasks.append(asyncio.to_thread(create_pr_comment, codebase, event.pull_request.number, welcome_message))
+
+    # Slack notification and PR comment are independent, so send them concurrently
+    await asyncio.gather(*tasks)
 
     return {
         "message": "PR opened event handled", 
@@ -148,27 +318,46 @@ def handle_pr_opened(event: PullRequestOpenedEvent):
         "pr_title": event.pull_request.title
     }
 
+# IDs of the bot's DM channels, filled at startup and kept current by slack_webhook
+_dm_channels: set[str] = set()
+
+def fetch_dm_channels() -> set[str]:
+    """List the IDs of all DM channels the bot is in."""
+    channels = set()
+    cursor = None
+    while True:
+        response = cg.slack.client.conversations_list(types="im", limit=1000, cursor=cursor)
+        channels.update(channel["id"] for channel in response["channels"])
+        cursor = response.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return channels
+
+@cg.app.on_event("startup")
+async def load_dm_channels():
+    """Prefetch the bot's DM channels so the first DMs aren't dropped."""
+    try:
+        _dm_channels.update(await asyncio.to_thread(fetch_dm_channels))
+    except Exception as e:
+        logger.warning(f"[SLACK] Could not list DM channels: {e}")
+
 @cg.slack.event("message")
 async def handle_message(event: SlackEvent):
     """Handle direct messages to the bot."""
-    # Only process messages that are direct messages (DMs)
-    # DM channels typically start with 'D'
-    if not event.channel.startswith('D'):
-        return {"message": "Not a DM, ignoring"}
-    
+    # Only process messages in the bot's DM channels. DMs opened while the
+    # startup listing was unavailable (e.g. without the im:read scope) are
+    # recognised by is_dm and added to the allowlist.
+    if event.channel not in _dm_channels:
+        if not is_dm(event):
+            return {"message": "Not a DM, ignoring"}
+        _dm_channels.add(event.channel)
+
     logger.info("[MESSAGE] Received direct message")
     
-    # Get codebase
-    codebase = cg.get_codebase()
-    
-    # Initialize code agent
-    agent = CodeAgent(codebase=codebase)
-    
     # Run the agent with the message text
-    response = agent.run(event.text)
+    response = await prompt_queue.submit(event.channel, event.text)
     
-    # Send response back to Slack
-    cg.slack.client.chat_postMessage(channel=event.channel, text=response, thread_ts=event.ts)
+    # Send response back to Slack (a blocking HTTP call, so keep it off the event loop)
+    await asyncio.to_thread(cg.slack.client.chat_postMessage, channel=event.channel, text=response, thread_ts=event.ts)
     
     return {"message": "DM handled", "response": response}
 
@@ -6,10 +6,16 @@ This module provides advanced codebase analysis capabilities for the Coder Agent
 enabling comprehensive examination of code structure, dependencies, and quality.
 """
 
+import ast
+import hashlib
+import heapq
 import logging
 import os
+import pickle
 import time
-from typing import Dict, Any, List, Optional, Union, Tuple
+from collections import Counter, defaultdict
+from functools import cached_property
+from typing import Dict, Any, Iterable, List, Optional, Set, Union, Tuple
 from enum import Enum
 from dataclasses import dataclass, field
 
@@ -18,13 +24,14 @@ from codegen.extensions.index.file_index import FileIndex
 from codegen.extensions.index.symbol_index import SymbolIndex
 from codegen.extensions.index.fcode_index import FCodeIndex
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# Suggested location for analysis results persisted across runs (disk caching is off unless a cache_dir is passed)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "codegen_analyzer")
+
+# Part of the disk cache key; bump it whenever analysis output changes so results from older code are ignored
+ANALYZER_VERSION = 3
+
 class AnalysisType(Enum):
     """Types of codebase analysis that can be performed."""
     DEPENDENCY_GRAPH = "dependency_graph"
@@ -35,7 +42,66 @@ class AnalysisType(Enum):
     ARCHITECTURE_PATTERNS = "architecture_patterns"
     FULL_ANALYSIS = "full_analysis"
 
-@dataclass
+# Analysis types by their string value
+_ANALYSIS_TYPE_BY_STR = {t.value: t for t in AnalysisType}
+
+# AST nodes that each add a decision point to a function
+_BRANCH_NODES = (
+    ast.If, ast.IfExp, ast.For, ast.AsyncFor, ast.While,
+    ast.ExceptHandler, ast.Assert, ast.comprehension, ast.match_case,
+)
+
+# AST nodes whose `else` block adds one more decision point, as radon counts them
+_ORELSE_NODES = (ast.For, ast.AsyncFor, ast.While, ast.Try)
+
+# AST nodes that open a new scope; their branches don't count towards the enclosing function
+_SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)
+
+def _cyclomatic_complexity(func: ast.AST) -> int:
+    """Compute the cyclomatic complexity of a function from its AST, excluding nested scopes."""
+    complexity = 1
+    stack = list(ast.iter_child_nodes(func))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, _SCOPE_NODES):
+            continue
+        if isinstance(node, _BRANCH_NODES):
+            complexity += 1
+        elif isinstance(node, ast.BoolOp):
+            complexity += len(node.values) - 1
+        if isinstance(node, _ORELSE_NODES) and node.orelse:
+            complexity += 1
+        elif isinstance(node, ast.comprehension):
+            # Each `if` clause of a comprehension is a branch of its own
+            complexity += len(node.ifs)
+        stack.extend(ast.iter_child_nodes(node))
+    return complexity
+
+def _function_complexities(tree: ast.AST) -> Iterable[Tuple[str, int]]:
+    """
+    Yield (qualified name, complexity) for every function in a module.
+    
+    Names follow __qualname__ ("Class.method", "outer.<locals>.inner"), so
+    same-named methods of different classes don't collide.
+    """
+    stack = [(tree, "")]
+    while stack:
+        node, prefix = stack.pop()
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                qualname = prefix + child.name
+                yield qualname, _cyclomatic_complexity(child)
+                stack.append((child, f"{qualname}.<locals>."))
+            elif isinstance(child, ast.ClassDef):
+                stack.append((child, f"{prefix}{child.name}."))
+            else:
+                stack.append((child, prefix))
+
+def _symbol_label(symbol: Tuple[str, str]) -> str:
+    """Format a (filepath, name) key as the "filepath:name" string used in analysis details."""
+    return f"{symbol[0]}:{symbol[1]}"
+
+@dataclass(slots=True)
 class AnalysisResult:
     """Results of a codebase analysis."""
     analysis_type: AnalysisType
@@ -59,22 +125,61 @@ class CodebaseAnalyzer:
     - Architecture pattern identification
     """
     
-    def __init__(self, codebase: Codebase):
+    def __init__(self, codebase: Codebase, cache_dir: Optional[str] = None):
         """
         Initialize the codebase analyzer.
         
         Args:
             codebase: The codebase to analyze
+            cache_dir: Directory to persist analysis results in (e.g. DEFAULT_CACHE_DIR), or None to keep them in memory only
         """
         self.codebase = codebase
-        self.file_index = FileIndex(codebase)
-        self.symbol_index = SymbolIndex(codebase)
-        self.fcode_index = FCodeIndex(codebase)
+        self.cache_dir = cache_dir
         
         # Cache for analysis results
         self.analysis_cache: Dict[str, AnalysisResult] = {}
         
-        logger.info(f"CodebaseAnalyzer initialized for {codebase.repo_path}")
+        # Cache for symbol dependency lookups, keyed by (name, filepath)
+        self._dep_cache: Dict[Tuple[str, str], Tuple[Tuple[str, str], ...]] = {}
+        
+        # Analysis method for each analysis type
+        self._dispatch = {
+            AnalysisType.DEPENDENCY_GRAPH: self._analyze_dependency_graph,
+            AnalysisType.COMPONENT_INTERACTION: self._analyze_component_interaction,
+            AnalysisType.TECHNICAL_DEBT: self._analyze_technical_debt,
+            AnalysisType.CYCLOMATIC_COMPLEXITY: self._analyze_cyclomatic_complexity,
+            AnalysisType.LIBRARY_OPTIMIZATION: self._analyze_library_optimization,
+            AnalysisType.ARCHITECTURE_PATTERNS: self._analyze_architecture_patterns,
+            AnalysisType.FULL_ANALYSIS: self._perform_full_analysis,
+        }
+        
+        logger.info("CodebaseAnalyzer initialized for %s", codebase.repo_path)
+    
+    @cached_property
+    def file_index(self) -> FileIndex:
+        """File index for the codebase, built on first use."""
+        return FileIndex(self.codebase)
+    
+    @cached_property
+    def symbol_index(self) -> SymbolIndex:
+        """Symbol index for the codebase, built on first use."""
+        return SymbolIndex(self.codebase)
+    
+    @cached_property
+    def fcode_index(self) -> FCodeIndex:
+        """FCode index for the codebase, built on first use."""
+        return FCodeIndex(self.codebase)
+    
+    @cached_property
+    def importers(self) -> Dict[str, Set[str]]:
+        """Paths of the files that import from each file, keyed by the imported file's path."""
+        importers = defaultdict(set)
+        for file in self.codebase.files:
+            for imp in file.imports:
+                target = imp.from_file
+                if target is not None and target.filepath != file.filepath:
+                    importers[target.filepath].add(file.filepath)
+        return importers
     
     def analyze(self, analysis_type: Union[AnalysisType, str], force_refresh: bool = False) -> AnalysisResult:
         """
@@ -89,42 +194,122 @@ class CodebaseAnalyzer:
         """
         # Convert string to enum if needed
         if isinstance(analysis_type, str):
-            try:
-                analysis_type = AnalysisType(analysis_type.lower())
-            except ValueError:
-                raise ValueError(f"Invalid analysis type: {analysis_type}. Must be one of {[t.value for t in AnalysisType]}")
+            parsed = _ANALYSIS_TYPE_BY_STR.get(analysis_type.lower())
+            if parsed is None:
+                raise ValueError(f"Invalid analysis type: {analysis_type}. Must be one of {list(_ANALYSIS_TYPE_BY_STR)}")
+            analysis_type = parsed
         
         # Check cache unless force_refresh is True
         cache_key = analysis_type.value
         if not force_refresh and cache_key in self.analysis_cache:
-            logger.info(f"Using cached analysis result for {analysis_type.value}")
+            logger.info("Using cached analysis result for %s", analysis_type.value)
             return self.analysis_cache[cache_key]
         
+        # Reuse a result persisted by an earlier run on the same commit
+        cache_path = self._disk_cache_path(cache_key)
+        if not force_refresh and cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as f:
+                    result = pickle.load(f)
+                logger.info("Using disk-cached analysis result for %s", analysis_type.value)
+                self.analysis_cache[cache_key] = result
+                return result
+            except Exception as e:
+                logger.warning("Ignoring unreadable analysis cache %s: %s", cache_path, e)
+        
+        # A forced refresh must not reuse dependency lookups from before the refresh
+        if force_refresh:
+            self._dep_cache.clear()
+        
         # Perform the requested analysis
-        logger.info(f"Performing {analysis_type.value} analysis")
-        
-        if analysis_type == AnalysisType.DEPENDENCY_GRAPH:
-            result = self._analyze_dependency_graph()
-        elif analysis_type == AnalysisType.COMPONENT_INTERACTION:
-            result = self._analyze_component_interaction()
-        elif analysis_type == AnalysisType.TECHNICAL_DEBT:
-            result = self._analyze_technical_debt()
-        elif analysis_type == AnalysisType.CYCLOMATIC_COMPLEXITY:
-            result = self._analyze_cyclomatic_complexity()
-        elif analysis_type == AnalysisType.LIBRARY_OPTIMIZATION:
-            result = self._analyze_library_optimization()
-        elif analysis_type == AnalysisType.ARCHITECTURE_PATTERNS:
-            result = self._analyze_architecture_patterns()
-        elif analysis_type == AnalysisType.FULL_ANALYSIS:
-            result = self._perform_full_analysis()
-        else:
+        logger.info("Performing %s analysis", analysis_type.value)
+        
+        analysis_method = self._dispatch.get(analysis_type)
+        if analysis_method is None:
             raise ValueError(f"Unsupported analysis type: {analysis_type}")
+        result = analysis_method()
         
         # Cache the result
         self.analysis_cache[cache_key] = result
+        if cache_path:
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                with open(cache_path, "wb") as f:
+                    pickle.dump(result, f)
+            except OSError as e:
+                logger.warning("Could not write analysis cache %s: %s", cache_path, e)
         
         return result
     
+    def invalidate(self, changed_files: Iterable[str]) -> None:
+        """
+        Drop cached state that depends on the given files.
+        
+        Every analysis reads the whole codebase, so all cached results and the
+        indexes are dropped. Unlike force_refresh, this keeps dependency lookups
+        for symbols that neither live in nor depend on a changed file, nor live in
+        a file that imports from one, so the next dependency graph analysis only
+        re-resolves the affected symbols.
+        
+        Args:
+            changed_files: Paths of the files that changed, relative to the repository root
+        """
+        changed = set(changed_files)
+        if not changed:
+            return
+        
+        # The indexes are cached_property values built from the old file contents
+        for index in ("file_index", "symbol_index", "fcode_index", "importers"):
+            self.__dict__.pop(index, None)
+        
+        if self._dep_cache:
+            # A changed file can start or stop defining names that other files import,
+            # which changes what their symbols resolve to. The importers are found from
+            # the new contents, so files that only now resolve an import into a changed
+            # or added file are included.
+            affected = set(changed)
+            for filepath in changed:
+                affected.update(self.importers.get(filepath, ()))
+            self._dep_cache = {
+                key: deps for key, deps in self._dep_cache.items()
+                if key[1] not in affected and not any(filepath in changed for filepath, _ in deps)
+            }
+        
+        stale = len(self.analysis_cache)
+        self.analysis_cache.clear()
+        
+        logger.info("Invalidated %d cached analyses for %d changed files", stale, len(changed))
+    
+    def _disk_cache_path(self, cache_key: str) -> Optional[str]:
+        """
+        Get the on-disk cache file for an analysis of the checked-out commit.
+        
+        The path is keyed by the analyzer version, the repository and the HEAD commit.
+        A working tree with uncommitted or untracked changes can't be identified by its
+        commit, so it isn't disk-cached at all.
+        
+        Args:
+            cache_key: The analysis cache key
+            
+        Returns:
+            The cache file path, or None if disk caching is disabled or doesn't apply
+        """
+        if not self.cache_dir:
+            return None
+        commit = self.codebase.current_commit
+        if commit is None:
+            return None
+        try:
+            if commit.repo.is_dirty(untracked_files=True):
+                logger.debug("Not using the analysis disk cache: working tree has uncommitted changes")
+                return None
+        except Exception as e:
+            logger.warning("Not using the analysis disk cache: %s", e)
+            return None
+        key = f"{ANALYZER_VERSION}:{self.codebase.repo_path}:{commit.hexsha}"
+        digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, digest, f"{cache_key}.pkl")
+    
     def _analyze_dependency_graph(self) -> AnalysisResult:
         """
         Analyze the dependency graph of the codebase.
@@ -134,55 +319,71 @@ class CodebaseAnalyzer:
         """
         logger.info("Analyzing dependency graph")
         
-        # Collect all symbols and their dependencies
+        # Collect all symbols and their dependencies, keyed by (filepath, name)
         symbols = self.symbol_index.get_all_symbols()
         dependencies = {}
         
         for symbol in symbols:
-            symbol_deps = self.symbol_index.get_symbol_dependencies(symbol.name, symbol.filepath)
-            dependencies[f"{symbol.filepath}:{symbol.name}"] = [
-                f"{dep.filepath}:{dep.name}" for dep in symbol_deps
-            ]
+            dependencies[(symbol.filepath, symbol.name)] = self._get_symbol_dependencies(symbol.name, symbol.filepath)
         
         # Identify highly connected components
-        connection_counts = {}
+        connection_counts = Counter()
+        total_deps = 0
         for symbol, deps in dependencies.items():
-            connection_counts[symbol] = len(deps)
-            for dep in deps:
-                if dep not in connection_counts:
-                    connection_counts[dep] = 0
-                connection_counts[dep] += 1
-        
-        # Sort by connection count
-        sorted_connections = sorted(
-            connection_counts.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )
+            total_deps += len(deps)
+            connection_counts[symbol] += len(deps)
+            connection_counts.update(deps)
+        
+        # Only the top 10 are reported, so select them without sorting every symbol
+        highly_connected = heapq.nlargest(10, connection_counts.items(), key=lambda x: x[1])
         
         # Generate recommendations
         recommendations = []
-        for symbol, count in sorted_connections[:5]:
+        for symbol, count in highly_connected[:5]:
             if count > 10:
                 recommendations.append(
-                    f"Consider refactoring {symbol} which has {count} connections"
+                    f"Consider refactoring {_symbol_label(symbol)} which has {count} connections"
                 )
         
         return AnalysisResult(
             analysis_type=AnalysisType.DEPENDENCY_GRAPH,
-            summary=f"Analyzed dependency graph with {len(symbols)} symbols and {sum(len(deps) for deps in dependencies.values())} dependencies",
+            summary=f"Analyzed dependency graph with {len(symbols)} symbols and {total_deps} dependencies",
+            # Tuples are only used internally; details keep the "filepath:name" strings
+            # consumers read, which also keeps the result JSON-serializable
             details={
-                "dependencies": dependencies,
-                "highly_connected": sorted_connections[:10]
+                "dependencies": {
+                    _symbol_label(symbol): [_symbol_label(dep) for dep in deps]
+                    for symbol, deps in dependencies.items()
+                },
+                "highly_connected": [(_symbol_label(symbol), count) for symbol, count in highly_connected]
             },
             metrics={
                 "symbol_count": len(symbols),
-                "dependency_count": sum(len(deps) for deps in dependencies.values()),
-                "avg_dependencies_per_symbol": sum(len(deps) for deps in dependencies.values()) / max(1, len(symbols))
+                "dependency_count": total_deps,
+                "avg_dependencies_per_symbol": total_deps / max(1, len(symbols))
             },
             recommendations=recommendations
         )
     
+    def _get_symbol_dependencies(self, name: str, filepath: str) -> Tuple[Tuple[str, str], ...]:
+        """
+        Get the dependencies of a symbol, resolving each symbol only once.
+        
+        Args:
+            name: The symbol name
+            filepath: The file the symbol is defined in
+            
+        Returns:
+            The dependencies as (filepath, name) tuples. The result is shared with the
+            cache and every analysis result that includes it, so it is immutable.
+        """
+        key = (name, filepath)
+        deps = self._dep_cache.get(key)
+        if deps is None:
+            deps = tuple((dep.filepath, dep.name) for dep in self.symbol_index.get_symbol_dependencies(name, filepath))
+            self._dep_cache[key] = deps
+        return deps
+    
     def _analyze_component_interaction(self) -> AnalysisResult:
         """
         Analyze component interactions in the codebase.
@@ -192,34 +393,34 @@ class CodebaseAnalyzer:
         """
         logger.info("Analyzing component interactions")
         
+        # codebase.files builds a new list on every access, so fetch the file objects once for both passes
+        files = self.codebase.files
+        
         # Identify components (directories with multiple files)
-        directories = {}
-        for file in self.codebase.files:
-            dir_path = os.path.dirname(file.filepath)
-            if dir_path not in directories:
-                directories[dir_path] = []
-            directories[dir_path].append(file.filepath)
+        directories = defaultdict(list)
+        for file in files:
+            directories[os.path.dirname(file.filepath)].append(file.filepath)
         
         # Filter to directories with multiple files
         components = {dir_path: files for dir_path, files in directories.items() if len(files) > 1}
         
-        # Analyze interactions between components
-        interactions = {}
-        for comp1, files1 in components.items():
-            interactions[comp1] = {}
-            for comp2, files2 in components.items():
-                if comp1 != comp2:
-                    interaction_count = 0
-                    for file1 in files1:
-                        for file2 in files2:
-                            # Check if file1 imports from file2
-                            file1_obj = self.codebase.get_file(file1)
-                            for imp in file1_obj.imports:
-                                if file2 in imp.source:
-                                    interaction_count += 1
-                    
-                    if interaction_count > 0:
-                        interactions[comp1][comp2] = interaction_count
+        # Map each component file back to its component
+        file_to_component = {filepath: comp for comp, files in components.items() for filepath in files}
+        
+        # Analyze interactions between components by walking every import once
+        interactions = {comp: Counter() for comp in components}
+        for file in files:
+            src = file_to_component.get(file.filepath)
+            if src is None:
+                continue
+            for imp in file.imports:
+                # Resolve the import to the file it imports from (to_file is the importing file itself);
+                # external modules and unresolved imports have no from_file
+                target = imp.from_file
+                dst = file_to_component.get(target.filepath) if target is not None else None
+                if dst is not None and dst != src:
+                    interactions[src][dst] += 1
+        interactions = {comp: dict(counts) for comp, counts in interactions.items()}
         
         # Generate recommendations
         recommendations = []
@@ -268,13 +469,45 @@ class CodebaseAnalyzer:
         Returns:
             Analysis result with cyclomatic complexity information
         """
-        # Implementation details for cyclomatic complexity analysis
+        logger.info("Analyzing cyclomatic complexity")
+        
+        # Parse each Python file once and score every function, keyed by "filepath:qualified name"
+        complexities = {}
+        for file in self.codebase.files:
+            if not file.filepath.endswith(".py"):
+                continue
+            try:
+                tree = ast.parse(file.content)
+            except SyntaxError:
+                logger.warning("Skipping %s: could not parse", file.filepath)
+                continue
+            for qualname, complexity in _function_complexities(tree):
+                complexities[f"{file.filepath}:{qualname}"] = complexity
+        
+        most_complex = heapq.nlargest(10, complexities.items(), key=lambda x: x[1])
+        
+        # Generate recommendations
+        recommendations = []
+        for name, complexity in most_complex[:5]:
+            if complexity > 10:
+                recommendations.append(
+                    f"Consider simplifying {name} which has a cyclomatic complexity of {complexity}"
+                )
+        
+        total_complexity = sum(complexities.values())
         return AnalysisResult(
             analysis_type=AnalysisType.CYCLOMATIC_COMPLEXITY,
-            summary="Cyclomatic complexity analysis placeholder",
-            details={},
-            metrics={},
-            recommendations=[]
+            summary=f"Analyzed cyclomatic complexity of {len(complexities)} functions",
+            details={
+                "complexities": complexities,
+                "most_complex": most_complex
+            },
+            metrics={
+                "function_count": len(complexities),
+                "max_complexity": most_complex[0][1] if most_complex else 0,
+                "avg_complexity": total_complexity / max(1, len(complexities))
+            },
+            recommendations=recommendations
         )
     
     def _analyze_library_optimization(self) -> AnalysisResult:
@@ -318,54 +551,46 @@ class CodebaseAnalyzer:
         """
         logger.info("Performing full codebase analysis")
         
-        # Perform all individual analyses
-        dependency_graph = self._analyze_dependency_graph()
-        component_interaction = self._analyze_component_interaction()
-        technical_debt = self._analyze_technical_debt()
-        cyclomatic_complexity = self._analyze_cyclomatic_complexity()
-        library_optimization = self._analyze_library_optimization()
-        architecture_patterns = self._analyze_architecture_patterns()
+        # Perform all individual analyses in turn. They share the lazily built indexes,
+        # _dep_cache and the SDK's Codebase, none of which are safe to fill from several threads.
+        analyses = {
+            "dependency_graph": self._analyze_dependency_graph,
+            "component_interaction": self._analyze_component_interaction,
+            "technical_debt": self._analyze_technical_debt,
+            "cyclomatic_complexity": self._analyze_cyclomatic_complexity,
+            "library_optimization": self._analyze_library_optimization,
+            "architecture_patterns": self._analyze_architecture_patterns,
+        }
+        results = {name: method() for name, method in analyses.items()}
         
         # Combine all recommendations
         all_recommendations = []
-        all_recommendations.extend(dependency_graph.recommendations)
-        all_recommendations.extend(component_interaction.recommendations)
-        all_recommendations.extend(technical_debt.recommendations)
-        all_recommendations.extend(cyclomatic_complexity.recommendations)
-        all_recommendations.extend(library_optimization.recommendations)
-        all_recommendations.extend(architecture_patterns.recommendations)
+        for result in results.values():
+            all_recommendations.extend(result.recommendations)
         
         # Create a comprehensive summary
         summary = (
             f"Full codebase analysis completed with {len(all_recommendations)} recommendations. "
-            f"Analyzed {dependency_graph.metrics.get('symbol_count', 0)} symbols and "
-            f"{component_interaction.metrics.get('component_count', 0)} components."
+            f"Analyzed {results['dependency_graph'].metrics.get('symbol_count', 0)} symbols and "
+            f"{results['component_interaction'].metrics.get('component_count', 0)} components."
         )
         
+        # Sub-results are included by reference rather than copied
         return AnalysisResult(
             analysis_type=AnalysisType.FULL_ANALYSIS,
             summary=summary,
-            details={
-                "dependency_graph": dependency_graph.details,
-                "component_interaction": component_interaction.details,
-                "technical_debt": technical_debt.details,
-                "cyclomatic_complexity": cyclomatic_complexity.details,
-                "library_optimization": library_optimization.details,
-                "architecture_patterns": architecture_patterns.details
-            },
-            metrics={
-                "dependency_graph": dependency_graph.metrics,
-                "component_interaction": component_interaction.metrics,
-                "technical_debt": technical_debt.metrics,
-                "cyclomatic_complexity": cyclomatic_complexity.metrics,
-                "library_optimization": library_optimization.metrics,
-                "architecture_patterns": architecture_patterns.metrics
-            },
+            details={name: result.details for name, result in results.items()},
+            metrics={name: result.metrics for name, result in results.items()},
             recommendations=all_recommendations
         )
 
 # Example usage
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
     from codegen import Codebase
     
     # Initialize a codebase
@@ -5,6 +5,7 @@ This script provides detailed error information when testing the Anthropic API.
 """
 
 import os
+import re
 import logging
 import anthropic
 from dotenv import load_dotenv
@@ -19,6 +20,32 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Shape of a well-formed Anthropic API key
+_KEY_RE = re.compile(r"sk-ant[\w-]+")
+
+def check_api_key_format(api_key):
+    """
+    Diagnose common formatting issues in an API key that doesn't look like an Anthropic key.
+    
+    Returns:
+        False if the key is unusable as written, True otherwise
+    """
+    if api_key.startswith('"') or api_key.endswith('"'):
+        logger.error("API key contains quote characters - please remove them from your .env file")
+        logger.info("Your .env file should contain: ANTHROPIC_API_KEY=sk-ant-api03-xxx")
+        logger.info("NOT: ANTHROPIC_API_KEY=\"sk-ant-api03-xxx\"")
+        return False
+    
+    if ">" in api_key or "<" in api_key:
+        logger.error("API key contains angle brackets - please remove them from your .env file")
+        logger.info("Your .env file should contain: ANTHROPIC_API_KEY=sk-ant-api03-xxx")
+        return False
+    
+    if not api_key.startswith("sk-ant"):
+        logger.warning("API key doesn't start with 'sk-ant' which is unusual for Anthropic keys")
+    
+    return True
+
 def debug_anthropic_api():
     """
     Test the Anthropic API with detailed error reporting.
@@ -36,21 +63,10 @@ def debug_anthropic_api():
     key_length = len(api_key)
     logger.info(f"API key prefix/suffix: {key_prefix}, length: {key_length}")
     
-    # Check for common formatting issues
-    if api_key.startswith('"') or api_key.endswith('"'):
-        logger.error("API key contains quote characters - please remove them from your .env file")
-        logger.info("Your .env file should contain: ANTHROPIC_API_KEY=sk-ant-api03-xxx")
-        logger.info("NOT: ANTHROPIC_API_KEY=\"sk-ant-api03-xxx\"")
-        return
-    
-    if ">" in api_key or "<" in api_key:
-        logger.error("API key contains angle brackets - please remove them from your .env file")
-        logger.info("Your .env file should contain: ANTHROPIC_API_KEY=sk-ant-api03-xxx")
+    # Well-formed keys skip the individual format checks
+    if not _KEY_RE.fullmatch(api_key) and not check_api_key_format(api_key):
         return
     
-    if not api_key.startswith("sk-ant"):
-        logger.warning("API key doesn't start with 'sk-ant' which is unusual for Anthropic keys")
-    
     try:
         # Initialize Anthropic client
         logger.info("Initializing Anthropic client...")
@@ -4,29 +4,43 @@ Enhanced Slack bot application with improved event handling.
 This version ensures proper handling of Slack events and responses.
 """
 
+import asyncio
+import hashlib
+import hmac
 import logging
 import os
-import json
-from fastapi import FastAPI, Request, Response, HTTPException
+import threading
+import time
+from string import Template
+import orjson
+from fastapi import BackgroundTasks, FastAPI, Request, Response, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
-from codegen import CodeAgent, CodegenApp
+from codegen import CodeAgent, CodegenApp, Codebase
 from codegen.extensions.github.types.events.pull_request import PullRequestLabeledEvent, PullRequestOpenedEvent
 from codegen.extensions.slack.types import SlackEvent
 from codegen.extensions.tools.github.create_pr_comment import create_pr_comment
 
 # Import custom modules
+from shared_codebase import SharedCodebase
 from slack_event_handler import SlackEventHandler
+from slack_filters import extract_challenge, forget_event_on_error, is_dm, is_duplicate_event
 from test_functions import send_slack_startup_message, test_anthropic_api
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Settings read once at startup rather than on every event
+USE_ANTHROPIC = os.environ.get("ANTHROPIC_API_KEY") is not None
+SLACK_NOTIFY_CHANNEL = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+SLACK_SIGNING_SECRET = os.environ.get("SLACK_SIGNING_SECRET")
+
 # Set up logging
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
@@ -35,17 +49,23 @@ logger = logging.getLogger(__name__)
 # Replace with your own repository as needed
 cg = CodegenApp(name="codegen", repo="Zeeeepa/cod")
 
+# Serialize handler return values with orjson instead of the stdlib encoder
+cg.app.router.default_response_class = ORJSONResponse
+
 # Initialize the Slack event handler
 slack_handler = SlackEventHandler(cg.slack.client)
 
-# Add CORS middleware for local development
-cg.app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # For development only, restrict in production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Add CORS middleware for local development only. Slack and GitHub webhooks
+# are server-to-server and never need it, so by default it stays off the
+# request path; set DEV_CORS=1 to enable it when testing from a browser.
+if os.environ.get("DEV_CORS") == "1":
+    cg.app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
 # Add a root endpoint for health checks
 @cg.app.get("/")
@@ -53,58 +73,170 @@ async def health_check():
     """Simple health check endpoint."""
     return {"status": "healthy", "app": "codegen-enhanced"}
 
+def verify_slack_signature(request: Request, raw: bytes) -> bool:
+    """
+    Check a Slack request's signature against its raw body.
+    Every request passes when SLACK_SIGNING_SECRET isn't set, e.g. during local development.
+    """
+    if not SLACK_SIGNING_SECRET:
+        return True
+
+    timestamp = request.headers.get("X-Slack-Request-Timestamp", "")
+    signature = request.headers.get("X-Slack-Signature", "")
+
+    # Reject stale timestamps so captured requests can't be replayed
+    try:
+        if abs(time.time() - int(timestamp)) > 60 * 5:
+            logger.warning("[SLACK] Rejecting request with stale timestamp")
+            return False
+    except ValueError:
+        logger.warning("[SLACK] Rejecting request without a valid timestamp")
+        return False
+
+    expected = "v0=" + hmac.new(
+        SLACK_SIGNING_SECRET.encode(), b"v0:" + timestamp.encode() + b":" + raw, hashlib.sha256
+    ).hexdigest()
+    if not hmac.compare_digest(expected, signature):
+        logger.warning("[SLACK] Rejecting request with invalid signature")
+        return False
+    return True
+
 @cg.app.post("/")
 async def root_slack_verification(request: Request):
     """
     Handle Slack URL verification at the root endpoint.
     This is needed because Slack is sending the verification to the root URL.
     """
-    logger.info("[SLACK] Received root webhook request")
+    logger.debug("[SLACK] Received root webhook request")
 
     try:
         # Get the request body
-        body = await request.json()
-        logger.info(f"[SLACK] Root request body type: {body.get('type', 'unknown')}")
+        raw = await request.body()
 
-        # Handle Slack URL verification challenge
-        if body.get("type") == "url_verification":
-            logger.info("[SLACK] Handling URL verification challenge at root")
-            challenge = body.get("challenge")
-            logger.info(f"[SLACK] Returning challenge from root: {challenge}")
+        # Only URL verification is handled here, so skip anything that isn't one
+        challenge = extract_challenge(raw)
+        if challenge is None:
+            return {"message": "Received webhook at root"}
 
-            # Return the challenge as plaintext as required by Slack
-            return Response(
-                content=challenge,
-                media_type="text/plain"
-            )
+        if not verify_slack_signature(request, raw):
+            return Response(status_code=401)
 
-        # For other types, you might want to redirect to your main handler
-        # or handle them directly here
-        return {"message": "Received webhook at root"}
+        # Handle Slack URL verification challenge
+        logger.info("[SLACK] Handling URL verification challenge at root")
+        logger.debug("[SLACK] Returning challenge from root: %s", challenge)
+
+        # Return the challenge as plaintext as required by Slack
+        return Response(
+            content=challenge,
+            media_type="text/plain"
+        )
 
     except Exception as e:
         logger.error(f"[SLACK] Error processing root webhook: {str(e)}")
         # Return a 200 OK response to avoid Slack retrying
         return Response(status_code=200)
 
+# Loading the codebase is expensive, so do it once and share it across handlers; pushes to the
+# default branch are applied to it in place by sync_codebase_to_push once running agents finish
+_codebase: Optional[Codebase] = None
+_codebase_lock = threading.Lock()
+
+def get_cached_codebase() -> Codebase:
+    """Get the shared codebase, loading it on first use."""
+    global _codebase
+    with _codebase_lock:
+        if _codebase is None:
+            logger.info("[CODEBASE] Initializing codebase")
+            _codebase = cg.get_codebase()
+        return _codebase
+
+async def get_codebase() -> Codebase:
+    """Get the shared codebase without blocking the event loop while it loads."""
+    if _codebase is not None:
+        return _codebase
+    return await asyncio.to_thread(get_cached_codebase)
+
+# Agents run on the shared codebase, pinned to the default branch while they run;
+# PR handlers read PR heads from a second clone, so the shared codebase never leaves the default branch
+codebases = SharedCodebase(get_cached_codebase, cg.repo, os.path.join(cg.tmp_dir, "pr-heads"))
+
+async def sync_codebase_to_push(payload: Dict[str, Any]):
+    """Check the shared codebase out at a push to the default branch, fetching and re-syncing its graph."""
+    if _codebase is None or payload.get("ref") != f"refs/heads/{payload.get('repository', {}).get('default_branch')}":
+        return
+    sha = payload.get("after")
+    if not sha or payload.get("deleted"):
+        return
+    # Background tasks run in turn, so a failure here must not stop the GitHub event handling queued after it
+    try:
+        await asyncio.to_thread(codebases.sync_default_branch, sha)
+    except Exception as e:
+        logger.error(f"[CODEBASE] Could not sync codebase to pushed commit {sha}: {str(e)}")
+
+# Cap concurrent agent runs so a message storm can't exhaust memory or LLM rate limits
+LLM_SEM = asyncio.Semaphore(int(os.environ.get("MAX_CONCURRENT_AGENTS", 8)))
+
+def run_on_default_branch(agent: CodeAgent, prompt: str) -> str:
+    """Run an agent while holding the shared codebase on the default branch."""
+    with codebases.default_branch():
+        return agent.run(prompt)
+
+# CodeAgent keeps per-run state, so concurrent runs each check out their own agent.
+# The pool never grows past the semaphore size. Pooled agents serve different Slack users,
+# so they are built without conversation memory.
+_idle_agents: List[CodeAgent] = []
+
+async def run_agent(prompt: str) -> str:
+    """Run a code agent on a prompt in a worker thread, at most MAX_CONCURRENT_AGENTS at a time."""
+    async with LLM_SEM:
+        codebase = await get_codebase()
+        if _idle_agents:
+            agent = _idle_agents.pop()
+        else:
+            logger.info("[CODE_AGENT] Initializing code agent")
+            agent = CodeAgent(codebase=codebase, memory=False)
+        try:
+            return await asyncio.to_thread(run_on_default_branch, agent, prompt)
+        finally:
+            _idle_agents.append(agent)
+
+async def process_slack_event(body: Dict[str, Any]):
+    """Run the Slack event handlers for a webhook payload after it has been acknowledged."""
+    try:
+        with forget_event_on_error(body):
+            await cg.slack.handle(body)
+    except Exception as e:
+        logger.error(f"[SLACK] Error processing event: {str(e)}")
+
+async def process_github_event(request: Request):
+    """Run the GitHub event handlers for a webhook request after it has been acknowledged."""
+    try:
+        result = await cg.github.handle_webhook(request)
+        # PR handlers are async, so await the coroutine they hand back
+        if hasattr(result, "__await__"):
+            await result
+    except Exception as e:
+        logger.error(f"[GITHUB] Error processing event: {str(e)}")
+
 @cg.app.post("/slack/events")
-async def slack_webhook(request: Request):
+async def slack_webhook(request: Request, background_tasks: BackgroundTasks):
     """
     Handle Slack webhook events, including URL verification.
     This is the endpoint that should be configured in your Slack app's Event Subscriptions.
     """
-    logger.info("[SLACK] Received webhook request at /slack/events")
+    logger.debug("[SLACK] Received webhook request at /slack/events")
 
     try:
-        # Get the request body
-        body = await request.json()
-        logger.info(f"[SLACK] Request body type: {body.get('type', 'unknown')}")
+        # Get the request body, rejecting unsigned requests before parsing it
+        raw = await request.body()
+        if not verify_slack_signature(request, raw):
+            return Response(status_code=401)
 
         # Handle Slack URL verification challenge
-        if body.get("type") == "url_verification":
+        challenge = extract_challenge(raw)
+        if challenge is not None:
             logger.info("[SLACK] Handling URL verification challenge")
-            challenge = body.get("challenge")
-            logger.info(f"[SLACK] Returning challenge: {challenge}")
+            logger.debug("[SLACK] Returning challenge: %s", challenge)
 
             # Return the challenge as plaintext as required by Slack
             return Response(
@@ -112,32 +244,48 @@ async def slack_webhook(request: Request):
                 media_type="text/plain"
             )
 
-        # Process the event through the normal event handlers
-        return await cg.slack.handle_webhook(request)
+        body = orjson.loads(raw)
+        logger.debug("[SLACK] Request body type: %s", body.get('type', 'unknown'))
+
+        # Slack redelivers events it thinks timed out; acknowledge those without handling them again
+        if is_duplicate_event(request, body):
+            return Response(status_code=200)
+
+        # Acknowledge right away so Slack doesn't retry, and handle the event afterwards
+        background_tasks.add_task(process_slack_event, body)
+        return Response(status_code=200)
     except Exception as e:
         logger.error(f"[SLACK] Error processing webhook: {str(e)}")
         # Return a 200 OK response to avoid Slack retrying
         return Response(status_code=200)
 
 @cg.app.post("/github/events")
-async def github_webhook(request: Request):
+async def github_webhook(request: Request, background_tasks: BackgroundTasks):
     """
     Handle GitHub webhook events.
     This is the endpoint that should be configured in your GitHub repository's webhook settings.
     """
-    logger.info("[GITHUB] Received webhook request")
+    logger.debug("[GITHUB] Received webhook request")
 
     try:
         # Get GitHub event type from header
         event_type = request.headers.get("X-GitHub-Event", "unknown")
-        logger.info(f"[GITHUB] Event type: {event_type}")
+        logger.debug("[GITHUB] Event type: %s", event_type)
 
         # Log GitHub webhook details
         delivery_id = request.headers.get("X-GitHub-Delivery", "unknown")
-        logger.info(f"[GITHUB] Delivery ID: {delivery_id}")
+        logger.debug("[GITHUB] Delivery ID: %s", delivery_id)
+
+        # Read the body now so it is cached on the request once the response has been sent
+        raw = await request.body()
 
-        # Process the event through the GitHub event handler
-        return await cg.github.handle_webhook(request)
+        # A push to the default branch changes the repository, so bring the cached codebase up to date
+        if event_type == "push":
+            background_tasks.add_task(sync_codebase_to_push, orjson.loads(raw))
+
+        # Acknowledge right away so GitHub doesn't time out, and handle the event afterwards
+        background_tasks.add_task(process_github_event, request)
+        return Response(status_code=200)
     except Exception as e:
         logger.error(f"[GITHUB] Error processing webhook: {str(e)}")
         # Return a 200 OK response to avoid GitHub retrying
@@ -146,114 +294,118 @@ async def github_webhook(request: Request):
 @cg.slack.event("app_mention")
 async def handle_mention(event: SlackEvent):
     """Handle mentions in Slack and respond with CodeAgent."""
-    logger.info("[APP_MENTION] Received app_mention event")
-    logger.info(event)
+    logger.debug("[APP_MENTION] Received app_mention event")
 
     # Check if Anthropic API is available
-    use_anthropic = os.environ.get("ANTHROPIC_API_KEY") is not None
-    
-    if use_anthropic:
+    if USE_ANTHROPIC:
         try:
-            # Codebase
-            logger.info("[CODEBASE] Initializing codebase")
-            codebase = cg.get_codebase()
-
-            # Code Agent
-            logger.info("[CODE_AGENT] Initializing code agent")
-            agent = CodeAgent(codebase=codebase)
-
-            logger.info("[CODE_AGENT] Running code agent")
-            response = agent.run(event.text)
+            logger.debug("[CODE_AGENT] Running code agent")
+            response = await run_agent(event.text)
 
             # Send response back to Slack
-            cg.slack.client.chat_postMessage(channel=event.channel, text=response, thread_ts=event.ts)
+            await asyncio.to_thread(cg.slack.client.chat_postMessage, channel=event.channel, text=response, thread_ts=event.ts)
             
             # Return response for logging
             return {"message": "Mentioned", "received_text": event.text, "response": response}
         except Exception as e:
             logger.error(f"[APP_MENTION] Error using CodeAgent: {str(e)}")
             # Fall back to the simple handler if there's an error
-            return slack_handler.handle_app_mention(event.__dict__, use_anthropic=False)
+            return await asyncio.to_thread(slack_handler.handle_app_mention, event.__dict__, use_anthropic=False)
     else:
         # Use the simple handler if Anthropic API is not available
-        return slack_handler.handle_app_mention(event.__dict__, use_anthropic=False)
+        return await asyncio.to_thread(slack_handler.handle_app_mention, event.__dict__, use_anthropic=False)
+
+# Slack notification templates for PR events
+PR_LABELED_MESSAGE = Template(
+    "*PR #$pr_number labeled with `$label`*\n"
+    "*Repository:* $repo_name\n"
+    "*Title:* $pr_title\n"
+    "*URL:* $pr_url"
+)
+
+PR_OPENED_MESSAGE = Template(
+    "*New PR #$pr_number opened*\n"
+    "*Repository:* $repo_name\n"
+    "*Title:* $pr_title\n"
+    "*URL:* $pr_url\n\n"
+    "*Description:*\n$pr_body"
+)
+
+# GitHub rejects comments over 65536 characters, so leave room for the surrounding markdown
+MAX_README_COMMENT_CHARS = 60000
+
+def read_pr_head(sha: str) -> tuple[str, int, int]:
+    """Check out a PR head and return its README and its file and function counts."""
+    with codebases.at_commit(sha) as codebase:
+        # Get README file
+        logger.info("> Getting README file")
+        readme = codebase.get_file("README.md").content
+        return readme, len(codebase.files), len(codebase.functions)
 
 @cg.github.event("pull_request:labeled")
-def handle_pr_labeled(event: PullRequestLabeledEvent):
+async def handle_pr_labeled(event: PullRequestLabeledEvent):
     """Handle PR labeled events and post a comment with README content."""
     logger.info("[PR_LABELED] PR labeled")
     logger.info(f"PR head sha: {event.pull_request.head.sha}")
 
-    # Get codebase
-    codebase = cg.get_codebase()
-
-    # Checkout commit
+    # Checkout commit (git I/O, so keep it off the event loop)
     logger.info("> Checking out commit")
-    codebase.checkout(commit=event.pull_request.head.sha)
+    content, num_files, num_functions = await asyncio.to_thread(read_pr_head, event.pull_request.head.sha)
 
-    # Get README file
-    logger.info("> Getting README file")
-    file = codebase.get_file("README.md")
+    # Get codebase
+    codebase = await get_codebase()
 
-    # Create PR comment
-    create_pr_comment(codebase, event.pull_request.number, f"File content:\n```markdown\n{file.content}\n```")
+    # Create PR comment, keeping large READMEs under GitHub's comment size limit
+    if len(content) > MAX_README_COMMENT_CHARS:
+        content = content[:MAX_README_COMMENT_CHARS] + "\n…(truncated)"
+    comment = "".join(["File content:\n```markdown\n", content, "\n```"])
+    await asyncio.to_thread(create_pr_comment, codebase, event.pull_request.number, comment)
 
     # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set
-    slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+    slack_channel = SLACK_NOTIFY_CHANNEL
     if slack_channel:
         logger.info(f"> Notifying Slack channel {slack_channel}")
-        repo_name = event.repository.full_name
-        pr_number = event.pull_request.number
-        pr_title = event.pull_request.title
-        pr_url = event.pull_request.html_url
-        label = event.label.name
-
-        message = (
-            f"*PR #{pr_number} labeled with `{label}`*\n"
-            f"*Repository:* {repo_name}\n"
-            f"*Title:* {pr_title}\n"
-            f"*URL:* {pr_url}"
+        message = PR_LABELED_MESSAGE.substitute(
+            pr_number=event.pull_request.number,
+            label=event.label.name,
+            repo_name=event.repository.full_name,
+            pr_title=event.pull_request.title,
+            pr_url=event.pull_request.html_url,
         )
 
-        cg.slack.client.chat_postMessage(channel=slack_channel, text=message)
+        await asyncio.to_thread(cg.slack.client.chat_postMessage, channel=slack_channel, text=message)
 
     return {
         "message": "PR labeled event handled",
-        "num_files": len(codebase.files),
-        "num_functions": len(codebase.functions)
+        "num_files": num_files,
+        "num_functions": num_functions
     }
 
 @cg.github.event("pull_request:opened")
-def handle_pr_opened(event: PullRequestOpenedEvent):
+async def handle_pr_opened(event: PullRequestOpenedEvent):
     """Handle PR opened events and notify Slack."""
     logger.info("[PR_OPENED] PR opened")
 
     # Get codebase
-    codebase = cg.get_codebase()
+    codebase = await get_codebase()
 
     # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set
-    slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+    slack_channel = SLACK_NOTIFY_CHANNEL
     if slack_channel:
         logger.info(f"> Notifying Slack channel {slack_channel}")
-        repo_name = event.repository.full_name
-        pr_number = event.pull_request.number
-        pr_title = event.pull_request.title
-        pr_url = event.pull_request.html_url
-        pr_body = event.pull_request.body or "No description provided"
-
-        message = (
-            f"*New PR #{pr_number} opened*\n"
-            f"*Repository:* {repo_name}\n"
-            f"*Title:* {pr_title}\n"
-            f"*URL:* {pr_url}\n\n"
-            f"*Description:*\n{pr_body}"
+        message = PR_OPENED_MESSAGE.substitute(
+            pr_number=event.pull_request.number,
+            repo_name=event.repository.full_name,
+            pr_title=event.pull_request.title,
+            pr_url=event.pull_request.html_url,
+            pr_body=event.pull_request.body or "No description provided",
         )
 
-        cg.slack.client.chat_postMessage(channel=slack_channel, text=message)
+        await asyncio.to_thread(cg.slack.client.chat_postMessage, channel=slack_channel, text=message)
 
     # Add a welcome comment to the PR
     welcome_message = "Thanks for opening this PR! :tada:\n\nI'll analyze your changes and provide feedback shortly."
-    create_pr_comment(codebase, event.pull_request.number, welcome_message)
+    await asyncio.to_thread(create_pr_comment, codebase, event.pull_request.number, welcome_message)
 
     return {
         "message": "PR opened event handled",
@@ -265,45 +417,47 @@ def handle_pr_opened(event: PullRequestOpenedEvent):
 async def handle_message(event: SlackEvent):
     """Handle direct messages to the bot."""
     # Only process messages that are direct messages (DMs)
-    # DM channels typically start with 'D'
-    if not event.channel.startswith('D'):
+    if not is_dm(event):
         return {"message": "Not a DM, ignoring"}
 
-    logger.info("[MESSAGE] Received direct message")
+    logger.debug("[MESSAGE] Received direct message")
     
     # Check if Anthropic API is available
-    use_anthropic = os.environ.get("ANTHROPIC_API_KEY") is not None
-    
-    if use_anthropic:
+    if USE_ANTHROPIC:
         try:
-            # Get codebase
-            codebase = cg.get_codebase()
-            
-            # Initialize code agent
-            agent = CodeAgent(codebase=codebase)
-            
             # Run the agent with the message text
-            response = agent.run(event.text)
+            response = await run_agent(event.text)
             
             # Send response back to Slack
-            cg.slack.client.chat_postMessage(channel=event.channel, text=response, thread_ts=event.ts)
+            await asyncio.to_thread(cg.slack.client.chat_postMessage, channel=event.channel, text=response, thread_ts=event.ts)
             
             return {"message": "DM handled", "response": response}
         except Exception as e:
             logger.error(f"[MESSAGE] Error using CodeAgent: {str(e)}")
             # Fall back to the simple handler if there's an error
-            return slack_handler.handle_direct_message(event.__dict__, use_anthropic=False)
+            return await asyncio.to_thread(slack_handler.handle_direct_message, event.__dict__, use_anthropic=False)
     else:
         # Use the simple handler if Anthropic API is not available
-        return slack_handler.handle_direct_message(event.__dict__, use_anthropic=False)
+        return await asyncio.to_thread(slack_handler.handle_direct_message, event.__dict__, use_anthropic=False)
 
 ########################################################################################################################
 # LOCAL SERVER STARTUP
 ########################################################################################################################
 
+_startup_message_task: Optional[asyncio.Task] = None
+
+async def send_startup_message_later(delay: float = 5):
+    """Send the Slack startup message after a delay without holding up startup."""
+    await asyncio.sleep(delay)
+    await asyncio.to_thread(send_slack_startup_message, 0)
+
+async def schedule_startup_message():
+    """Schedule the Slack startup message on the server's event loop."""
+    global _startup_message_task
+    _startup_message_task = asyncio.create_task(send_startup_message_later())
+
 if __name__ == "__main__":
     import uvicorn
-    import threading
 
     # Log environment check
     if not os.environ.get("SLACK_BOT_TOKEN"):
@@ -323,11 +477,9 @@ if __name__ == "__main__":
         else:
             logger.warning("Anthropic API test failed. Falling back to simple responses.")
 
-    # Send a startup message to Slack
+    # Send a startup message to Slack once the server is up
     logger.info("Sending startup message to Slack...")
-    slack_thread = threading.Thread(target=send_slack_startup_message, args=(5,))  # Send after 5 seconds
-    slack_thread.daemon = True
-    slack_thread.start()
+    cg.app.add_event_handler("startup", schedule_startup_message)
 
     # Log the available routes for debugging
     logger.info("Available API routes:")
@@ -347,5 +499,15 @@ if __name__ == "__main__":
     logger.info("  1. Configure GitHub webhook URL with: <https://your-ngrok-url/github/events>")
     logger.info("  2. Set content type to application/json")
 
-    # Run the FastAPI app locally
-    uvicorn.run(cg.app, host="0.0.0.0", port=port, log_level="info")
\ No newline at end of file
+    # Run the FastAPI app locally. uvicorn picks uvloop and httptools automatically when they are
+    # installed (fastapi[standard] pulls them in). Keep it to one worker process: the parsed
+    # codebase, the agent pool, LLM_SEM and Slack event dedupe are per-process. Extra workers
+    # would each re-parse the repository, and a Slack retry that lands on another worker would be
+    # handled twice.
+    uvicorn.run(
+        cg.app,
+        host="0.0.0.0",
+        port=port,
+        log_level="info",
+        access_log=False,
+    )
\ No newline at end of file
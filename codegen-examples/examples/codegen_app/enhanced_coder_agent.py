@@ -7,43 +7,61 @@ capabilities to provide more sophisticated code modifications and recommendation
 """
 
 import logging
-import os
-import time
-from typing import Dict, Any, List, Optional, Union, Callable
-from enum import Enum
+import re
+from functools import cached_property
 
 from codegen import CodeAgent, Codebase
-from codegen.extensions.langchain.agent import (
-    create_codebase_agent,
-    create_chat_agent,
-    create_codebase_inspector_agent,
-    create_agent_with_tools
-)
-from codegen.extensions.langchain.tools import (
-    CreateFileTool,
-    DeleteFileTool,
-    GlobalReplacementEditTool,
-    ListDirectoryTool,
-    MoveSymbolTool,
-    ReflectionTool,
-    RelaceEditTool,
-    RenameFileTool,
-    ReplacementEditTool,
-    RevealSymbolTool,
-    RipGrepTool,
-    SearchFilesByNameTool,
-    ViewFileTool,
-)
 
 from codebase_analyzer import CodebaseAnalyzer, AnalysisType, AnalysisResult
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# Tool names exposed by the agent; they never change, so build the list once
+_AVAILABLE_TOOLS = (
+    # Standard code agent tools
+    "view_file",
+    "list_directory",
+    "ripgrep_search",
+    "create_file",
+    "delete_file",
+    "rename_file",
+    "move_symbol",
+    "reveal_symbol",
+    "relace_edit",
+    "replacement_edit",
+    "global_replacement",
+    "search_files_by_name",
+    "reflection",
+    # Analysis tools
+    *(f"analyze_{t.value}" for t in AnalysisType),
+)
+
+# Phrases that explicitly request an analysis type, in priority order
+_EXPLICIT_ANALYSIS_PHRASES = {
+    "analyze dependencies": AnalysisType.DEPENDENCY_GRAPH,
+    "dependency graph": AnalysisType.DEPENDENCY_GRAPH,
+    "analyze components": AnalysisType.COMPONENT_INTERACTION,
+    "component interaction": AnalysisType.COMPONENT_INTERACTION,
+    "technical debt": AnalysisType.TECHNICAL_DEBT,
+    "cyclomatic complexity": AnalysisType.CYCLOMATIC_COMPLEXITY,
+    "code complexity": AnalysisType.CYCLOMATIC_COMPLEXITY,
+    "library optimization": AnalysisType.LIBRARY_OPTIMIZATION,
+    "optimize libraries": AnalysisType.LIBRARY_OPTIMIZATION,
+    "architecture patterns": AnalysisType.ARCHITECTURE_PATTERNS,
+    "design patterns": AnalysisType.ARCHITECTURE_PATTERNS,
+    "full analysis": AnalysisType.FULL_ANALYSIS,
+    "analyze codebase": AnalysisType.FULL_ANALYSIS,
+}
+_EXPLICIT_PHRASE_PRIORITY = {phrase: i for i, phrase in enumerate(_EXPLICIT_ANALYSIS_PHRASES)}
+_EXPLICIT_ANALYSIS_RE = re.compile("|".join(map(re.escape, _EXPLICIT_ANALYSIS_PHRASES)))
+
+# Keywords that imply a full analysis would help
+_IMPLICIT_ANALYSIS_RE = re.compile("|".join([
+    "analyze", "analysis", "structure", "architecture",
+    "dependencies", "complexity", "quality", "patterns",
+    "refactor", "improve", "optimize"
+]))
+
 class EnhancedCoderAgent:
     """
     Enhanced coder agent that leverages advanced codebase analysis capabilities
@@ -77,20 +95,40 @@ class EnhancedCoderAgent:
         self.model_provider = model_provider
         self.model_name = model_name
         self.memory = memory
-        
-        # Initialize the code agent
-        self.code_agent = CodeAgent(
-            codebase=codebase,
-            model_provider=model_provider,
-            model_name=model_name,
-            memory=memory,
-            **kwargs
-        )
+        self.agent_kwargs = kwargs
         
         # Initialize the codebase analyzer
         self.analyzer = CodebaseAnalyzer(codebase)
         
-        logger.info(f"EnhancedCoderAgent initialized with {model_provider}/{model_name}")
+        logger.info("EnhancedCoderAgent initialized with %s/%s", model_provider, model_name)
+    
+    @cached_property
+    def code_agent(self) -> CodeAgent:
+        """
+        The underlying code agent, built on first use.
+        
+        Analysis-only callers (e.g. analyze_codebase) never need it, so they
+        don't pay for constructing the LLM agent.
+        """
+        return CodeAgent(
+            codebase=self.codebase,
+            model_provider=self.model_provider,
+            model_name=self.model_name,
+            memory=self.memory,
+            **self.agent_kwargs
+        )
+    
+    def reset_memory(self) -> None:
+        """
+        Forget the conversation so far.
+        
+        The next run builds a fresh code agent; cached analysis results are kept.
+        """
+        self.__dict__.pop("code_agent", None)
+    
+    def reset_analysis(self) -> None:
+        """Drop cached analysis results, e.g. after the codebase moved to another commit."""
+        self.analyzer = CodebaseAnalyzer(self.codebase)
     
     def run(self, prompt: str) -> str:
         """
@@ -108,14 +146,14 @@ class EnhancedCoderAgent:
         Returns:
             The agent's response
         """
-        logger.info(f"Running EnhancedCoderAgent with prompt: {prompt[:100]}...")
+        logger.info("Running EnhancedCoderAgent with prompt: %.100s...", prompt)
         
         # Check if the prompt is requesting codebase analysis
         analysis_type = self._determine_analysis_type(prompt)
         
         if analysis_type:
             # Perform the requested analysis
-            logger.info(f"Performing {analysis_type.value} analysis based on prompt")
+            logger.info("Performing %s analysis based on prompt", analysis_type.value)
             analysis_result = self.analyzer.analyze(analysis_type)
             
             # Enhance the prompt with analysis results
@@ -127,7 +165,7 @@ class EnhancedCoderAgent:
             # No analysis needed, run the code agent with the original prompt
             return self.code_agent.run(prompt)
     
-    def _determine_analysis_type(self, prompt: str) -> Optional[AnalysisType]:
+    def _determine_analysis_type(self, prompt: str) -> AnalysisType | None:
         """
         Determine if the prompt is requesting codebase analysis and which type.
         
@@ -139,30 +177,13 @@ class EnhancedCoderAgent:
         """
         prompt_lower = prompt.lower()
         
-        # Check for explicit analysis requests
-        if "analyze dependencies" in prompt_lower or "dependency graph" in prompt_lower:
-            return AnalysisType.DEPENDENCY_GRAPH
-        elif "analyze components" in prompt_lower or "component interaction" in prompt_lower:
-            return AnalysisType.COMPONENT_INTERACTION
-        elif "technical debt" in prompt_lower:
-            return AnalysisType.TECHNICAL_DEBT
-        elif "cyclomatic complexity" in prompt_lower or "code complexity" in prompt_lower:
-            return AnalysisType.CYCLOMATIC_COMPLEXITY
-        elif "library optimization" in prompt_lower or "optimize libraries" in prompt_lower:
-            return AnalysisType.LIBRARY_OPTIMIZATION
-        elif "architecture patterns" in prompt_lower or "design patterns" in prompt_lower:
-            return AnalysisType.ARCHITECTURE_PATTERNS
-        elif "full analysis" in prompt_lower or "analyze codebase" in prompt_lower:
-            return AnalysisType.FULL_ANALYSIS
+        # Check for explicit analysis requests, preferring the highest-priority phrase found
+        matches = _EXPLICIT_ANALYSIS_RE.findall(prompt_lower)
+        if matches:
+            return _EXPLICIT_ANALYSIS_PHRASES[min(matches, key=_EXPLICIT_PHRASE_PRIORITY.__getitem__)]
         
         # Check for implicit analysis requests
-        analysis_keywords = [
-            "analyze", "analysis", "structure", "architecture", 
-            "dependencies", "complexity", "quality", "patterns",
-            "refactor", "improve", "optimize"
-        ]
-        
-        if any(keyword in prompt_lower for keyword in analysis_keywords):
+        if _IMPLICIT_ANALYSIS_RE.search(prompt_lower):
             # Implicit analysis request, perform a full analysis
             return AnalysisType.FULL_ANALYSIS
         
@@ -180,31 +201,31 @@ class EnhancedCoderAgent:
             The enhanced prompt
         """
         # Create a summary of the analysis
-        analysis_summary = f"\n\n--- Codebase Analysis ({analysis_result.analysis_type.value}) ---\n"
-        analysis_summary += f"{analysis_result.summary}\n\n"
+        parts = [
+            f"\n\n--- Codebase Analysis ({analysis_result.analysis_type.value}) ---\n",
+            f"{analysis_result.summary}\n\n",
+        ]
         
-        # Add key metrics
+        # Add key metrics, skipping nested ones
         if analysis_result.metrics:
-            analysis_summary += "Key Metrics:\n"
-            for key, value in analysis_result.metrics.items():
-                if isinstance(value, dict):
-                    continue  # Skip nested metrics
-                analysis_summary += f"- {key}: {value}\n"
-            analysis_summary += "\n"
+            parts.append("Key Metrics:\n")
+            parts.extend(
+                f"- {key}: {value}\n"
+                for key, value in analysis_result.metrics.items()
+                if not isinstance(value, dict)
+            )
+            parts.append("\n")
         
         # Add recommendations
         if analysis_result.recommendations:
-            analysis_summary += "Recommendations:\n"
-            for rec in analysis_result.recommendations:
-                analysis_summary += f"- {rec}\n"
-            analysis_summary += "\n"
+            parts.append("Recommendations:\n")
+            parts.extend(f"- {rec}\n" for rec in analysis_result.recommendations)
+            parts.append("\n")
         
         # Combine the original prompt with the analysis summary
-        enhanced_prompt = f"{prompt}\n\n{analysis_summary}\nPlease consider the above analysis in your response."
-        
-        return enhanced_prompt
+        return f"{prompt}\n\n{''.join(parts)}\nPlease consider the above analysis in your response."
     
-    def analyze_codebase(self, analysis_type: Union[AnalysisType, str], force_refresh: bool = False) -> AnalysisResult:
+    def analyze_codebase(self, analysis_type: AnalysisType | str, force_refresh: bool = False) -> AnalysisResult:
         """
         Perform a specific type of codebase analysis.
         
@@ -217,37 +238,22 @@ class EnhancedCoderAgent:
         """
         return self.analyzer.analyze(analysis_type, force_refresh)
     
-    def get_available_tools(self) -> List[str]:
+    def get_available_tools(self) -> list[str]:
         """
         Get a list of all available tools that can be used with the agent.
         
         Returns:
             List of tool names
         """
-        # Standard code agent tools
-        tools = [
-            "view_file",
-            "list_directory",
-            "ripgrep_search",
-            "create_file",
-            "delete_file",
-            "rename_file",
-            "move_symbol",
-            "reveal_symbol",
-            "relace_edit",
-            "replacement_edit",
-            "global_replacement",
-            "search_files_by_name",
-            "reflection"
-        ]
-        
-        # Analysis tools
-        analysis_tools = [f"analyze_{t.value}" for t in AnalysisType]
-        
-        return tools + analysis_tools
+        return list(_AVAILABLE_TOOLS)
 
 # Example usage
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
     from codegen import Codebase
     
     # Initialize a codebase
@@ -6,14 +6,18 @@ This application demonstrates how to use the Enhanced Coder Agent with the
 Message Orchestrator to create a powerful code analysis and improvement system.
 """
 
+import asyncio
 import logging
 import os
-import json
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Dict, Any, Optional
 
+import orjson
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -22,6 +26,10 @@ from codegen.extensions.github.types.events.pull_request import PullRequestLabel
 from codegen.extensions.slack.types import SlackEvent
 from codegen.extensions.tools.github.create_pr_comment import create_pr_comment
 
+from shared_codebase import SharedCodebase, current_sha
+from slack_filters import extract_challenge, forget_event_on_error, is_channel_message, is_dm, is_duplicate_event
+from slack_sender import SlackSender
+
 # Import the MessageOrchestrator
 from message_orchestrator import (
     MessageOrchestrator, MessageContext, ConversationFlow, 
@@ -30,11 +38,15 @@ from message_orchestrator import (
 
 # Import the EnhancedCoderAgent
 from enhanced_coder_agent import EnhancedCoderAgent
-from codebase_analyzer import AnalysisType
+from codebase_analyzer import AnalysisType, CodebaseAnalyzer
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Settings read once at startup rather than on every event
+SLACK_NOTIFY_CHANNEL = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+PORT = int(os.environ.get("PORT", 8000))
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -46,24 +58,159 @@ logger = logging.getLogger(__name__)
 # Replace with your own repository as needed
 cg = CodegenApp(name="codegen", repo="Zeeeepa/cod")
 
+# Serialize handler return values with orjson instead of the stdlib encoder
+cg.app.router.default_response_class = ORJSONResponse
+
 # Initialize the MessageOrchestrator
 orchestrator = MessageOrchestrator(cg.slack.client)
 
-# Add CORS middleware for local development
-cg.app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # For development only, restrict in production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Outgoing notifications go through a per-channel, rate-limited queue
+slack_sender = SlackSender(cg.slack.client)
+
+# Agents run on cg's codebase, pinned to the default branch while they run;
+# PR handlers read PR heads from a second clone, so neither waits on the other
+codebases = SharedCodebase(cg.get_codebase, cg.repo, os.path.join(cg.tmp_dir, "pr-heads"))
+
+# Idle EnhancedCoderAgents on the default-branch codebase, each with the
+# commit its analyzer last ran on. Each run checks one out so concurrent
+# workers never share an agent, and its analyzer's cached results carry over
+# until a push moves the codebase to another commit. Agents serve different
+# Slack users, so their conversation is reset before they go back in the pool.
+_idle_agents: list[tuple[EnhancedCoderAgent, Optional[str]]] = []
+_agent_lock = threading.Lock()
+
+def acquire_agent(codebase: Codebase) -> EnhancedCoderAgent:
+    """Take an idle agent, or build one on `codebase` if none is free. Call under codebases.default_branch."""
+    with _agent_lock:
+        entry = _idle_agents.pop() if _idle_agents else None
+    if entry is None:
+        return EnhancedCoderAgent(codebase)
+    agent, analyzed_sha = entry
+    if analyzed_sha != current_sha(codebase):
+        agent.reset_analysis()
+    return agent
+
+def release_agent(agent: EnhancedCoderAgent):
+    """Reset an agent's conversation and return it to the idle pool. Call under codebases.default_branch."""
+    agent.reset_memory()
+    entry = (agent, current_sha(agent.codebase))
+    with _agent_lock:
+        _idle_agents.append(entry)
+
+# Agent runs take far longer than Slack's 3s retry window, so handlers only
+# enqueue the work and a pool of workers runs it off the request path
+AGENT_WORKERS = int(os.environ.get("AGENT_WORKERS", "4"))
+_work_queue: asyncio.Queue = asyncio.Queue(maxsize=1024)
+_workers: list[asyncio.Task] = []
+
+# All blocking agent, codebase and GitHub work shares one bounded pool, so
+# bursts can't run more of it at once than AGENT_POOL_SIZE
+AGENT_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("AGENT_POOL_SIZE", "4")),
+    thread_name_prefix="agent",
 )
 
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on AGENT_POOL without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(AGENT_POOL, partial(func, *args, **kwargs))
+
+def enqueue_work(func, *args) -> bool:
+    """Queue a blocking call for the worker pool, dropping it if the queue is full."""
+    try:
+        _work_queue.put_nowait((func, args))
+        return True
+    except asyncio.QueueFull:
+        logger.warning("[WORKER] Queue full, dropping %s", func.__name__)
+        return False
+
+async def _worker():
+    """Run queued calls on AGENT_POOL so they don't block the event loop."""
+    while True:
+        func, args = await _work_queue.get()
+        try:
+            await run_blocking(func, *args)
+        except Exception:
+            logger.exception("[WORKER] Error running %s", func.__name__)
+        finally:
+            _work_queue.task_done()
+
+@cg.app.on_event("startup")
+async def start_workers():
+    """Start the agent worker pool and Slack sender on the server's event loop."""
+    slack_sender.start()
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(AGENT_WORKERS))
+
+@cg.app.on_event("shutdown")
+async def stop_workers():
+    """Stop the workers and abandon any blocking work that hasn't started."""
+    for task in _workers:
+        task.cancel()
+    AGENT_POOL.shutdown(wait=False, cancel_futures=True)
+
+# Add CORS middleware for local development only. Slack and GitHub webhooks
+# are server-to-server and never need it, so by default it stays off the
+# request path; set DEV_CORS=1 to enable it when testing from a browser.
+if os.environ.get("DEV_CORS") == "1":
+    cg.app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
 # Add a root endpoint for health checks
 @cg.app.get("/")
 async def health_check():
     """Simple health check endpoint."""
     return {"status": "healthy", "app": "enhanced-coder-app"}
 
+async def _get_body(request: Request) -> tuple[bytes, Dict[str, Any]]:
+    """
+    Read and parse the request body once per request.
+
+    The parsed body is also stored where Starlette's request.json() looks for
+    it, so forwarding the request to cg.slack.handle_webhook doesn't parse the
+    JSON a second time.
+    """
+    cached = getattr(request.state, "cached_body", None)
+    if cached is None:
+        body_bytes = await request.body()
+        body = orjson.loads(body_bytes)
+        request._json = body
+        cached = request.state.cached_body = (body_bytes, body)
+    return cached
+
+async def _handle_url_verification(body: Dict[str, Any]) -> Response:
+    """Answer Slack's URL verification challenge."""
+    logger.info("[ROOT] Handling URL verification challenge")
+    challenge = body.get("challenge")
+    logger.debug("[ROOT] Returning challenge: %s", challenge)
+
+    # Return the challenge as plaintext as required by Slack
+    return Response(
+        content=challenge,
+        media_type="text/plain"
+    )
+
+async def _handle_event_callback(body: Dict[str, Any]) -> Optional[Response]:
+    """Route a Slack event callback to its enhanced handler, if there is one."""
+    logger.info("[ROOT] Handling Slack event callback")
+    event_data = body.get("event", {})
+    event_type = event_data.get("type")
+    
+    logger.info("[ROOT] Event type: %s", event_type)
+    
+    handler = EVENT_TYPE_HANDLERS.get(event_type)
+    if handler is None:
+        return None
+    return await handler(event_data)
+
+SLACK_TYPE_HANDLERS = {
+    "url_verification": _handle_url_verification,
+    "event_callback": _handle_event_callback,
+}
+
 @cg.app.post("/")
 async def root_handler(request: Request):
     """
@@ -73,59 +220,52 @@ async def root_handler(request: Request):
     logger.info("[ROOT] Received POST request")
 
     try:
-        # Get the request body
-        body_bytes = await request.body()
-        body_str = body_bytes.decode('utf-8')
-        
-        # Log the raw request for debugging
-        logger.info(f"[ROOT] Raw request body: {body_str[:200]}...")
-        
+        # Answer URL verification from the raw bytes when we can
+        challenge = extract_challenge(await request.body())
+        if challenge is not None:
+            logger.info("[ROOT] Handling URL verification challenge")
+            return Response(content=challenge, media_type="text/plain")
+
+        # Get the request body, parsed once for this handler and cg.slack
         try:
-            body = json.loads(body_str)
-        except json.JSONDecodeError:
+            body_bytes, body = await _get_body(request)
+        except orjson.JSONDecodeError:
             logger.error("[ROOT] Failed to parse JSON body")
             return Response(status_code=200)  # Return 200 to avoid retries
         
-        logger.info(f"[ROOT] Request body type: {body.get('type', 'unknown')}")
-
-        # Handle Slack URL verification challenge
-        if body.get("type") == "url_verification":
-            logger.info("[ROOT] Handling URL verification challenge")
-            challenge = body.get("challenge")
-            logger.info(f"[ROOT] Returning challenge: {challenge}")
-
-            # Return the challenge as plaintext as required by Slack
-            return Response(
-                content=challenge,
-                media_type="text/plain"
-            )
-        
-        # Handle Slack events
-        if body.get("type") == "event_callback":
-            logger.info("[ROOT] Handling Slack event callback")
-            event_data = body.get("event", {})
-            event_type = event_data.get("type")
-            
-            logger.info(f"[ROOT] Event type: {event_type}")
-            
-            # Handle app_mention events
-            if event_type == "app_mention":
-                return await handle_app_mention_enhanced(event_data)
-            
-            # Handle direct message events
-            if event_type == "message" and event_data.get("channel_type") == "im":
-                return await handle_direct_message_enhanced(event_data)
+        # Log the raw request for debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[ROOT] Raw request body: %s...", body_bytes[:200].decode('utf-8', 'replace'))
+        logger.info("[ROOT] Request body type: %s", body.get('type', 'unknown'))
+
+        # Channel chatter would only be dropped by the message handler, so ACK
+        # it before dedupe bookkeeping or dispatch
+        if is_channel_message(body.get("event") or {}):
+            return Response(status_code=200)
+
+        # Slack redelivers events it thinks timed out; only handle each once
+        if is_duplicate_event(request, body):
+            return Response(status_code=200)
+
+        # Dispatch on the payload type; handlers return None to defer to cg.slack
+        handler = SLACK_TYPE_HANDLERS.get(body.get("type"))
+        if handler is not None:
+            with forget_event_on_error(body):
+                response = await handler(body)
+            if response is not None:
+                return response
         
         # For other types, try to pass to the standard handler
         try:
-            # Recreate the request with the same body for the standard handler
-            return await cg.slack.handle_webhook(request)
+            # The body is cached on the request, so the standard handler reuses it
+            with forget_event_on_error(body):
+                return await cg.slack.handle_webhook(request)
         except Exception as e:
-            logger.error(f"[ROOT] Error in standard handler: {str(e)}")
+            logger.error("[ROOT] Error in standard handler: %s", e)
             return Response(status_code=200)  # Return 200 to avoid retries
 
     except Exception as e:
-        logger.error(f"[ROOT] Error processing request: {str(e)}")
+        logger.error("[ROOT] Error processing request: %s", e)
         # Return a 200 OK response to avoid Slack retrying
         return Response(status_code=200)
 
@@ -138,26 +278,38 @@ async def slack_webhook(request: Request):
     logger.info("[SLACK] Received webhook request at /slack/events")
 
     try:
-        # Get the request body
-        body_bytes = await request.body()
-        body_str = body_bytes.decode('utf-8')
-        
-        # Log the raw request for debugging
-        logger.info(f"[SLACK] Raw request body: {body_str[:200]}...")
-        
+        # Answer URL verification from the raw bytes when we can
+        challenge = extract_challenge(await request.body())
+        if challenge is not None:
+            logger.info("[SLACK] Handling URL verification challenge")
+            return Response(content=challenge, media_type="text/plain")
+
+        # Get the request body, parsed once for this handler and cg.slack
         try:
-            body = json.loads(body_str)
-        except json.JSONDecodeError:
+            body_bytes, body = await _get_body(request)
+        except orjson.JSONDecodeError:
             logger.error("[SLACK] Failed to parse JSON body")
             return Response(status_code=200)  # Return 200 to avoid retries
         
-        logger.info(f"[SLACK] Request body type: {body.get('type', 'unknown')}")
+        # Log the raw request for debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[SLACK] Raw request body: %s...", body_bytes[:200].decode('utf-8', 'replace'))
+        logger.info("[SLACK] Request body type: %s", body.get('type', 'unknown'))
+
+        # Channel chatter would only be dropped by the message handler, so ACK
+        # it before dedupe bookkeeping or dispatch
+        if is_channel_message(body.get("event") or {}):
+            return Response(status_code=200)
+
+        # Slack redelivers events it thinks timed out; only handle each once
+        if is_duplicate_event(request, body):
+            return Response(status_code=200)
 
         # Handle Slack URL verification challenge
         if body.get("type") == "url_verification":
             logger.info("[SLACK] Handling URL verification challenge")
             challenge = body.get("challenge")
-            logger.info(f"[SLACK] Returning challenge: {challenge}")
+            logger.debug("[SLACK] Returning challenge: %s", challenge)
 
             # Return the challenge as plaintext as required by Slack
             return Response(
@@ -166,9 +318,10 @@ async def slack_webhook(request: Request):
             )
 
         # Process the event through the normal event handlers
-        return await cg.slack.handle_webhook(request)
+        with forget_event_on_error(body):
+            return await cg.slack.handle_webhook(request)
     except Exception as e:
-        logger.error(f"[SLACK] Error processing webhook: {str(e)}")
+        logger.error("[SLACK] Error processing webhook: %s", e)
         # Return a 200 OK response to avoid Slack retrying
         return Response(status_code=200)
 
@@ -183,16 +336,16 @@ async def github_webhook(request: Request):
     try:
         # Get GitHub event type from header
         event_type = request.headers.get("X-GitHub-Event", "unknown")
-        logger.info(f"[GITHUB] Event type: {event_type}")
+        logger.info("[GITHUB] Event type: %s", event_type)
 
         # Log GitHub webhook details
         delivery_id = request.headers.get("X-GitHub-Delivery", "unknown")
-        logger.info(f"[GITHUB] Delivery ID: {delivery_id}")
+        logger.info("[GITHUB] Delivery ID: %s", delivery_id)
 
         # Process the event through the GitHub event handler
         return await cg.github.handle_webhook(request)
     except Exception as e:
-        logger.error(f"[GITHUB] Error processing webhook: {str(e)}")
+        logger.error("[GITHUB] Error processing webhook: %s", e)
         # Return a 200 OK response to avoid GitHub retrying
         return Response(status_code=200)
 
@@ -208,7 +361,7 @@ def handle_enhanced_coder_flow(flow: ConversationFlow, event: Dict[str, Any]) ->
     Returns:
         A dictionary with information about the handled event
     """
-    logger.info(f"[ENHANCED_CODER_FLOW] Handling flow {flow.flow_id}")
+    logger.info("[ENHANCED_CODER_FLOW] Handling flow %s", flow.flow_id)
     
     # Extract the message text
     text = event.get("text", "")
@@ -218,14 +371,16 @@ def handle_enhanced_coder_flow(flow: ConversationFlow, event: Dict[str, Any]) ->
         text = text.replace(f"<@{orchestrator.bot_user_id}>", "").strip()
     
     try:
-        # Get codebase
-        codebase = cg.get_codebase()
-        
-        # Initialize enhanced coder agent
-        agent = EnhancedCoderAgent(codebase)
-        
-        # Run the agent with the message text
-        response = agent.run(text)
+        # Get codebase, held on the default branch for the whole run
+        with codebases.default_branch() as codebase:
+            # Reuse an idle enhanced coder agent for this codebase
+            agent = acquire_agent(codebase)
+            
+            # Run the agent with the message text
+            try:
+                response = agent.run(text)
+            finally:
+                release_agent(agent)
         
         # Send the response through the orchestrator
         orchestrator.send_message(flow, response)
@@ -239,7 +394,7 @@ def handle_enhanced_coder_flow(flow: ConversationFlow, event: Dict[str, Any]) ->
             "response": response
         }
     except Exception as e:
-        logger.error(f"[ENHANCED_CODER_FLOW] Error using EnhancedCoderAgent: {str(e)}")
+        logger.error("[ENHANCED_CODER_FLOW] Error using EnhancedCoderAgent: %s", e)
         
         # Send a fallback response
         fallback_response = (
@@ -268,10 +423,8 @@ async def handle_app_mention_enhanced(event_data):
     """
     logger.info("[APP_MENTION_ENHANCED] Processing app_mention event")
     
-    # Use the orchestrator to handle the event
-    result = orchestrator.handle_event(event_data)
-    
-    logger.info(f"[APP_MENTION_ENHANCED] Orchestrator result: {result}")
+    # Hand the event to the orchestrator in the background and ACK right away
+    enqueue_work(orchestrator.handle_event, event_data)
     
     return Response(status_code=200)
 
@@ -281,72 +434,72 @@ async def handle_direct_message_enhanced(event_data):
     """
     logger.info("[DM_ENHANCED] Processing direct message event")
     
-    # Use the orchestrator to handle the event
-    result = orchestrator.handle_event(event_data)
-    
-    logger.info(f"[DM_ENHANCED] Orchestrator result: {result}")
+    # Hand the event to the orchestrator in the background and ACK right away
+    enqueue_work(orchestrator.handle_event, event_data)
     
     return Response(status_code=200)
 
+# Enhanced handlers for event callbacks received at the root URL
+EVENT_TYPE_HANDLERS = {
+    "app_mention": handle_app_mention_enhanced,
+    "message": handle_direct_message_enhanced,
+}
+
 @cg.slack.event("app_mention")
 async def handle_mention(event: SlackEvent):
     """Handle mentions in Slack using the EnhancedCoderAgent."""
     logger.info("[APP_MENTION] Received app_mention event")
     
-    # Convert the SlackEvent to a dictionary
-    event_dict = event.__dict__
-    
-    # Use the orchestrator to handle the event
-    result = orchestrator.handle_event(event_dict)
+    # Hand the event to the orchestrator in the background
+    enqueue_work(orchestrator.handle_event, event)
     
-    logger.info(f"[APP_MENTION] Orchestrator result: {result}")
-    
-    return {"message": "Mention handled through orchestrator"}
+    return {"message": "Mention queued for orchestrator"}
+
+@cg.github.event("push")
+async def handle_push(event: dict):
+    """Move the agents' codebase to new commits on the default branch."""
+    default_ref = f"refs/heads/{event['repository'].get('default_branch')}"
+    if event.get("ref") != default_ref or event.get("deleted") or not event.get("after"):
+        return {"message": "Push ignored"}
+
+    # Waits for running agents to finish, so do it in the background
+    enqueue_work(codebases.sync_default_branch, event["after"])
+
+    return {"message": "Default branch sync queued"}
 
 @cg.slack.event("message")
 async def handle_message(event: SlackEvent):
     """Handle direct messages to the bot using the EnhancedCoderAgent."""
     # Only process messages that are direct messages (DMs)
-    # DM channels typically start with 'D'
-    if not event.channel.startswith('D'):
+    if not is_dm(event):
         return {"message": "Not a DM, ignoring"}
 
     logger.info("[MESSAGE] Received direct message")
     
-    # Convert the SlackEvent to a dictionary
-    event_dict = event.__dict__
-    
-    # Use the orchestrator to handle the event
-    result = orchestrator.handle_event(event_dict)
-    
-    logger.info(f"[MESSAGE] Orchestrator result: {result}")
+    # Hand the event to the orchestrator in the background
+    enqueue_work(orchestrator.handle_event, event)
     
-    return {"message": "DM handled through orchestrator"}
+    return {"message": "DM queued for orchestrator"}
 
 @cg.github.event("pull_request:labeled")
-def handle_pr_labeled(event: PullRequestLabeledEvent):
+async def handle_pr_labeled(event: PullRequestLabeledEvent):
     """Handle PR labeled events and post a comment with README content."""
     logger.info("[PR_LABELED] PR labeled")
-    logger.info(f"PR head sha: {event.pull_request.head.sha}")
 
-    # Get codebase
-    codebase = cg.get_codebase()
+    # The checkout and PR comment are slow, so run them in the background and ACK GitHub now
+    enqueue_work(process_pr_labeled, event)
 
-    # Checkout commit
-    logger.info("> Checking out commit")
-    codebase.checkout(commit=event.pull_request.head.sha)
+    return {"message": "PR labeled event queued", "pr_number": event.pull_request.number}
 
-    # Get README file
-    logger.info("> Getting README file")
-    file = codebase.get_file("README.md")
+def process_pr_labeled(event: PullRequestLabeledEvent):
+    """Notify Slack, then comment on the PR with the README at its head."""
+    logger.info("PR head sha: %s", event.pull_request.head.sha)
 
-    # Create PR comment
-    create_pr_comment(codebase, event.pull_request.number, f"File content:\n```markdown\n{file.content}\n```")
-
-    # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set
-    slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+    # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set; queued first so it
+    # goes out while the checkout and PR comment run
+    slack_channel = SLACK_NOTIFY_CHANNEL
     if slack_channel:
-        logger.info(f"> Notifying Slack channel {slack_channel}")
+        logger.info("> Notifying Slack channel %s", slack_channel)
         repo_name = event.repository.full_name
         pr_number = event.pull_request.number
         pr_title = event.pull_request.title
@@ -360,40 +513,47 @@ def handle_pr_labeled(event: PullRequestLabeledEvent):
             f"*URL:* {pr_url}"
         )
 
-        cg.slack.client.chat_postMessage(channel=slack_channel, text=message)
+        slack_sender.send_threadsafe(slack_channel, message, batchable=True)
+
+    # Read everything that depends on the PR head while it stays checked out
+    logger.info("> Checking out PR head")
+    with codebases.at_commit(event.pull_request.head.sha) as codebase:
+        # Get README file
+        logger.info("> Getting README file")
+        readme = codebase.get_file("README.md").content
+        num_files, num_functions = len(codebase.files), len(codebase.functions)
+
+    # Create PR comment
+    create_pr_comment(codebase, event.pull_request.number, f"File content:\n```markdown\n{readme}\n```")
 
     return {
         "message": "PR labeled event handled",
-        "num_files": len(codebase.files),
-        "num_functions": len(codebase.functions)
+        "num_files": num_files,
+        "num_functions": num_functions
     }
 
 @cg.github.event("pull_request:opened")
-def handle_pr_opened(event: PullRequestOpenedEvent):
-    """Handle PR opened events and notify Slack."""
+async def handle_pr_opened(event: PullRequestOpenedEvent):
+    """Handle PR opened events by queueing the analysis and notifications."""
     logger.info("[PR_OPENED] PR opened")
 
-    # Get codebase
-    codebase = cg.get_codebase()
+    # The full analysis is slow, so run it in the background and ACK GitHub now
+    enqueue_work(process_pr_opened, event)
 
-    # Initialize enhanced coder agent for PR analysis
-    agent = EnhancedCoderAgent(codebase)
-    
-    # Analyze the PR
-    analysis_result = agent.analyze_codebase(AnalysisType.FULL_ANALYSIS)
-    
-    # Create a summary of the analysis
-    analysis_summary = f"## Codebase Analysis\n\n{analysis_result.summary}\n\n"
-    
-    if analysis_result.recommendations:
-        analysis_summary += "### Recommendations\n\n"
-        for rec in analysis_result.recommendations:
-            analysis_summary += f"- {rec}\n"
-    
-    # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set
-    slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+    return {
+        "message": "PR opened event queued for analysis",
+        "pr_number": event.pull_request.number,
+        "pr_title": event.pull_request.title
+    }
+
+def process_pr_opened(event: PullRequestOpenedEvent):
+    """Notify Slack about a newly opened PR, then analyze the codebase and comment on the PR."""
+    # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set. The message doesn't
+    # depend on the analysis and is posted by the sender's own task, so queue
+    # it first and let it go out while the analysis runs.
+    slack_channel = SLACK_NOTIFY_CHANNEL
     if slack_channel:
-        logger.info(f"> Notifying Slack channel {slack_channel}")
+        logger.info("> Notifying Slack channel %s", slack_channel)
         repo_name = event.repository.full_name
         pr_number = event.pull_request.number
         pr_title = event.pull_request.title
@@ -408,7 +568,19 @@ def handle_pr_opened(event: PullRequestOpenedEvent):
             f"*Description:*\n{pr_body}"
         )
 
-        cg.slack.client.chat_postMessage(channel=slack_channel, text=message)
+        slack_sender.send_threadsafe(slack_channel, message, batchable=True)
+
+    # Analyze the PR head while it stays checked out. Pooled agents are bound
+    # to the default-branch codebase, so the PR clone gets its own analyzer.
+    with codebases.at_commit(event.pull_request.head.sha) as codebase:
+        analysis_result = CodebaseAnalyzer(codebase).analyze(AnalysisType.FULL_ANALYSIS)
+    
+    # Create a summary of the analysis
+    parts = [f"## Codebase Analysis\n\n{analysis_result.summary}\n\n"]
+    if analysis_result.recommendations:
+        parts.append("### Recommendations\n\n")
+        parts.extend(f"- {rec}\n" for rec in analysis_result.recommendations)
+    analysis_summary = "".join(parts)
 
     # Add a welcome comment to the PR with analysis
     welcome_message = (
@@ -418,12 +590,6 @@ def handle_pr_opened(event: PullRequestOpenedEvent):
     )
     create_pr_comment(codebase, event.pull_request.number, welcome_message)
 
-    return {
-        "message": "PR opened event handled with analysis",
-        "pr_number": event.pull_request.number,
-        "pr_title": event.pull_request.title
-    }
-
 def send_slack_startup_message(delay=5):
     """
     Send a message to Slack after a specified delay.
@@ -434,11 +600,11 @@ def send_slack_startup_message(delay=5):
     """
     # Wait for the specified delay
     if delay > 0:
-        logger.info(f"Waiting {delay} seconds before sending Slack message...")
+        logger.info("Waiting %s seconds before sending Slack message...", delay)
         time.sleep(delay)
     
     # Get Slack credentials from environment
-    slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+    slack_channel = SLACK_NOTIFY_CHANNEL
     
     if not slack_channel:
         logger.error("SLACK_NOTIFICATION_CHANNEL not found in environment variables")
@@ -446,16 +612,21 @@ def send_slack_startup_message(delay=5):
     
     try:
         # Send message
-        response = cg.slack.client.chat_postMessage(
-            channel=slack_channel,
-            text="🚀 *Enhanced Coder Bot Started Successfully!* 🚀\n"
-                 "The Enhanced Coder Agent is now available with advanced codebase analysis capabilities."
+        slack_sender.send_threadsafe(
+            slack_channel,
+            "🚀 *Enhanced Coder Bot Started Successfully!* 🚀\n"
+            "The Enhanced Coder Agent is now available with advanced codebase analysis capabilities."
         )
-        logger.info(f"Slack startup message sent successfully: {response['ts']}")
-        return response
+        logger.info("Slack startup message queued")
     except Exception as e:
-        logger.error(f"Error sending Slack message: {str(e)}")
-        return None
+        logger.error("Error sending Slack message: %s", e)
+
+def format_routes() -> list[str]:
+    """Describe each registered route as "  METHODS path" for the startup log."""
+    return [
+        f"  {','.join(route.methods) if hasattr(route, 'methods') else 'GET'} {route.path}"
+        for route in cg.app.routes
+    ]
 
 ########################################################################################################################
 # LOCAL SERVER STARTUP
@@ -481,16 +652,10 @@ if __name__ == "__main__":
     slack_thread.start()
 
     # Log the available routes for debugging
-    logger.info("Available API routes:")
-    for route in cg.app.routes:
-        methods = ','.join(route.methods) if hasattr(route, "methods") else "GET"
-        logger.info(f"  {methods} {route.path}")
-
-    # Get port from environment or use default
-    port = int(os.environ.get("PORT", 8000))
+    logger.info("Available API routes:\n%s", "\n".join(format_routes()))
 
     # Print startup message
-    logger.info(f"Starting Enhanced Coder Bot on 0.0.0.0:{port}")
+    logger.info("Starting Enhanced Coder Bot on 0.0.0.0:%s", PORT)
     logger.info("For Slack integration:")
     logger.info("  1. Use ngrok: ngrok http 8000")
     logger.info("  2. Configure Slack Events API URL with: <https://your-ngrok-url/>")
@@ -499,5 +664,15 @@ if __name__ == "__main__":
     logger.info("  1. Configure GitHub webhook URL with: <https://your-ngrok-url/github/events>")
     logger.info("  2. Set content type to application/json")
 
-    # Run the FastAPI app locally
-    uvicorn.run(cg.app, host="0.0.0.0", port=port, log_level="info")
\ No newline at end of file
+    # Run the FastAPI app locally. uvicorn picks uvloop and httptools automatically when they are
+    # installed (fastapi[standard] pulls them in). Keep it to one worker process: the parsed
+    # codebase, the agent and worker pools and Slack event dedupe are per-process. Extra workers
+    # would each re-parse the repository, and a Slack retry that lands on another worker would be
+    # handled twice.
+    uvicorn.run(
+        cg.app,
+        host="0.0.0.0",
+        port=PORT,
+        log_level="info",
+        access_log=False,
+    )
\ No newline at end of file
@@ -1,7 +1,12 @@
+import asyncio
 import logging
 import os
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import orjson
 from fastapi import FastAPI, Request, Response, HTTPException, status, Header, Depends
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from typing import Optional
@@ -11,12 +16,20 @@ from codegen.extensions.github.types.events.pull_request import PullRequestLabel
 from codegen.extensions.slack.types import SlackEvent
 from codegen.extensions.tools.github.create_pr_comment import create_pr_comment
 
+from shared_codebase import SharedCodebase
+from slack_filters import extract_challenge, forget_event_on_error, is_channel_message, is_dm, is_duplicate_event
+from slack_sender import SlackSender
+
 # Import test functions
 from test_functions import run_tests
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Settings read once at startup rather than on every event
+SLACK_NOTIFY_CHANNEL = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+PORT = int(os.environ.get("PORT", 8000))
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -28,15 +41,78 @@ logger = logging.getLogger(__name__)
 # Replace with your own repository as needed
 cg = CodegenApp(name="codegen", repo="Zeeeepa/cod")
 
-# Add CORS middleware for local development
-cg.app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # For development only, restrict in production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Serialize handler return values with orjson instead of the stdlib encoder
+cg.app.router.default_response_class = ORJSONResponse
+
+# Outgoing notifications go through a per-channel, rate-limited queue
+slack_sender = SlackSender(cg.slack.client)
+
+# Agents run on cg's codebase, pinned to the default branch while they run;
+# PR handlers read PR heads from a second clone, so neither waits on the other
+codebases = SharedCodebase(cg.get_codebase, cg.repo, os.path.join(cg.tmp_dir, "pr-heads"))
+
+# Agent runs take far longer than Slack's 3s retry window, so handlers only
+# enqueue the work and a pool of workers runs it off the request path
+AGENT_WORKERS = int(os.environ.get("AGENT_WORKERS", "4"))
+_work_queue: asyncio.Queue = asyncio.Queue(maxsize=1024)
+_workers: list[asyncio.Task] = []
+
+# All blocking agent, codebase and GitHub work shares one bounded pool, so
+# bursts can't run more of it at once than AGENT_POOL_SIZE
+AGENT_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("AGENT_POOL_SIZE", "4")),
+    thread_name_prefix="agent",
 )
 
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on AGENT_POOL without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(AGENT_POOL, partial(func, *args, **kwargs))
+
+def enqueue_work(func, *args) -> bool:
+    """Queue a blocking call for the worker pool, dropping it if the queue is full."""
+    try:
+        _work_queue.put_nowait((func, args))
+        return True
+    except asyncio.QueueFull:
+        logger.warning("[WORKER] Queue full, dropping %s", func.__name__)
+        return False
+
+async def _worker():
+    """Run queued calls on AGENT_POOL so they don't block the event loop."""
+    while True:
+        func, args = await _work_queue.get()
+        try:
+            await run_blocking(func, *args)
+        except Exception:
+            logger.exception("[WORKER] Error running %s", func.__name__)
+        finally:
+            _work_queue.task_done()
+
+@cg.app.on_event("startup")
+async def start_workers():
+    """Start the agent worker pool and Slack sender on the server's event loop."""
+    slack_sender.start()
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(AGENT_WORKERS))
+
+@cg.app.on_event("shutdown")
+async def stop_workers():
+    """Stop the workers and abandon any blocking work that hasn't started."""
+    for task in _workers:
+        task.cancel()
+    AGENT_POOL.shutdown(wait=False, cancel_futures=True)
+
+# Add CORS middleware for local development only. Slack and GitHub webhooks
+# are server-to-server and never need it, so by default it stays off the
+# request path; set DEV_CORS=1 to enable it when testing from a browser.
+if os.environ.get("DEV_CORS") == "1":
+    cg.app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
 # Add a root endpoint for health checks
 @cg.app.get("/")
 async def health_check():
@@ -52,15 +128,21 @@ async def root_slack_verification(request: Request):
     logger.info("[SLACK] Received root webhook request")
 
     try:
+        # Answer URL verification from the raw bytes when we can
+        challenge = extract_challenge(await request.body())
+        if challenge is not None:
+            logger.info("[SLACK] Handling URL verification challenge")
+            return Response(content=challenge, media_type="text/plain")
+
         # Get the request body
-        body = await request.json()
-        logger.info(f"[SLACK] Root request body type: {body.get('type', 'unknown')}")
+        body = orjson.loads(await request.body())
+        logger.info("[SLACK] Root request body type: %s", body.get('type', 'unknown'))
 
         # Handle Slack URL verification challenge
         if body.get("type") == "url_verification":
             logger.info("[SLACK] Handling URL verification challenge at root")
             challenge = body.get("challenge")
-            logger.info(f"[SLACK] Returning challenge from root: {challenge}")
+            logger.debug("[SLACK] Returning challenge from root: %s", challenge)
 
             # Return the challenge as plaintext as required by Slack
             return Response(
@@ -73,7 +155,7 @@ async def root_slack_verification(request: Request):
         return {"message": "Received webhook at root"}
 
     except Exception as e:
-        logger.error(f"[SLACK] Error processing root webhook: {str(e)}")
+        logger.error("[SLACK] Error processing root webhook: %s", e)
         # Return a 200 OK response to avoid Slack retrying
         return Response(status_code=200)
 
@@ -86,15 +168,31 @@ async def slack_webhook(request: Request):
     logger.info("[SLACK] Received webhook request at /slack/events")
 
     try:
-        # Get the request body
-        body = await request.json()
-        logger.info(f"[SLACK] Request body type: {body.get('type', 'unknown')}")
+        # Answer URL verification from the raw bytes when we can
+        challenge = extract_challenge(await request.body())
+        if challenge is not None:
+            logger.info("[SLACK] Handling URL verification challenge")
+            return Response(content=challenge, media_type="text/plain")
+
+        # Get the request body; seed request.json() so cg.slack doesn't parse it again
+        body = orjson.loads(await request.body())
+        request._json = body
+        logger.info("[SLACK] Request body type: %s", body.get('type', 'unknown'))
+
+        # Channel chatter would only be dropped by the message handler, so ACK
+        # it before dedupe bookkeeping or dispatch
+        if is_channel_message(body.get("event") or {}):
+            return Response(status_code=200)
+
+        # Slack redelivers events it thinks timed out; only handle each once
+        if is_duplicate_event(request, body):
+            return Response(status_code=200)
 
         # Handle Slack URL verification challenge
         if body.get("type") == "url_verification":
             logger.info("[SLACK] Handling URL verification challenge")
             challenge = body.get("challenge")
-            logger.info(f"[SLACK] Returning challenge: {challenge}")
+            logger.debug("[SLACK] Returning challenge: %s", challenge)
 
             # Return the challenge as plaintext as required by Slack
             return Response(
@@ -103,9 +201,10 @@ async def slack_webhook(request: Request):
             )
 
         # Process the event through the normal event handlers
-        return await cg.slack.handle_webhook(request)
+        with forget_event_on_error(body):
+            return await cg.slack.handle_webhook(request)
     except Exception as e:
-        logger.error(f"[SLACK] Error processing webhook: {str(e)}")
+        logger.error("[SLACK] Error processing webhook: %s", e)
         # Return a 200 OK response to avoid Slack retrying
         return Response(status_code=200)
 
@@ -120,16 +219,16 @@ async def github_webhook(request: Request):
     try:
         # Get GitHub event type from header
         event_type = request.headers.get("X-GitHub-Event", "unknown")
-        logger.info(f"[GITHUB] Event type: {event_type}")
+        logger.info("[GITHUB] Event type: %s", event_type)
 
         # Log GitHub webhook details
         delivery_id = request.headers.get("X-GitHub-Delivery", "unknown")
-        logger.info(f"[GITHUB] Delivery ID: {delivery_id}")
+        logger.info("[GITHUB] Delivery ID: %s", delivery_id)
 
         # Process the event through the GitHub event handler
         return await cg.github.handle_webhook(request)
     except Exception as e:
-        logger.error(f"[GITHUB] Error processing webhook: {str(e)}")
+        logger.error("[GITHUB] Error processing webhook: %s", e)
         # Return a 200 OK response to avoid GitHub retrying
         return Response(status_code=200)
 
@@ -138,49 +237,57 @@ async def github_webhook(request: Request):
 async def handle_mention(event: SlackEvent):
     """Handle mentions in Slack and respond with CodeAgent."""
     logger.info("[APP_MENTION] Received app_mention event")
-    logger.info(event)
+    logger.debug("[APP_MENTION] Event: %s", event)
 
-    # Codebase
-    logger.info("[CODEBASE] Initializing codebase")
-    codebase = cg.get_codebase()
+    # Run the agent in the background so Slack gets its ACK right away
+    enqueue_work(reply_with_agent, event)
 
-    # Code Agent
-    logger.info("[CODE_AGENT] Initializing code agent")
-    agent = CodeAgent(codebase=codebase)
+    return {"message": "Mentioned", "received_text": event.text}
 
-    logger.info("[CODE_AGENT] Running code agent")
-    response = agent.run(event.text)
+def reply_with_agent(event: SlackEvent):
+    """Run the code agent on a Slack message and reply in its thread."""
+    # Codebase, held on the default branch for the whole run
+    logger.info("[CODEBASE] Initializing codebase")
+    with codebases.default_branch() as codebase:
+        # Code Agent
+        logger.info("[CODE_AGENT] Initializing code agent")
+        agent = CodeAgent(codebase=codebase)
 
-    # Send response back to Slack
-    cg.slack.client.chat_postMessage(channel=event.channel, text=response, thread_ts=event.ts)
+        logger.info("[CODE_AGENT] Running code agent")
+        response = agent.run(event.text)
 
-    # Return response for logging
-    return {"message": "Mentioned", "received_text": event.text, "response": response}
+    # Send response back to Slack
+    slack_sender.send_threadsafe(event.channel, response, thread_ts=event.ts)
 
 @cg.github.event("pull_request:labeled")
-def handle_pr_labeled(event: PullRequestLabeledEvent):
+async def handle_pr_labeled(event: PullRequestLabeledEvent):
     """Handle PR labeled events and post a comment with README content."""
     logger.info("[PR_LABELED] PR labeled")
-    logger.info(f"PR head sha: {event.pull_request.head.sha}")
 
-    # Get codebase
-    codebase = cg.get_codebase()
+    # The checkout and PR comment are slow, so run them in the background and ACK GitHub now
+    enqueue_work(process_pr_labeled, event)
 
-    # Checkout commit
-    logger.info("> Checking out commit")
-    codebase.checkout(commit=event.pull_request.head.sha)
+    return {"message": "PR labeled event queued", "pr_number": event.pull_request.number}
 
-    # Get README file
-    logger.info("> Getting README file")
-    file = codebase.get_file("README.md")
+def process_pr_labeled(event: PullRequestLabeledEvent):
+    """Check out the PR head, comment with its README and notify Slack."""
+    logger.info("PR head sha: %s", event.pull_request.head.sha)
+
+    # Read everything that depends on the PR head while it stays checked out
+    logger.info("> Checking out PR head")
+    with codebases.at_commit(event.pull_request.head.sha) as codebase:
+        # Get README file
+        logger.info("> Getting README file")
+        readme = codebase.get_file("README.md").content
+        num_files, num_functions = len(codebase.files), len(codebase.functions)
 
     # Create PR comment
-    create_pr_comment(codebase, event.pull_request.number, f"File content:\n```markdown\n{file.content}\n```")
+    create_pr_comment(codebase, event.pull_request.number, f"File content:\n```markdown\n{readme}\n```")
 
     # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set
-    slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+    slack_channel = SLACK_NOTIFY_CHANNEL
     if slack_channel:
-        logger.info(f"> Notifying Slack channel {slack_channel}")
+        logger.info("> Notifying Slack channel %s", slack_channel)
         repo_name = event.repository.full_name
         pr_number = event.pull_request.number
         pr_title = event.pull_request.title
@@ -194,26 +301,37 @@ def handle_pr_labeled(event: PullRequestLabeledEvent):
             f"*URL:* {pr_url}"
         )
 
-        cg.slack.client.chat_postMessage(channel=slack_channel, text=message)
+        slack_sender.send_threadsafe(slack_channel, message, batchable=True)
 
     return {
         "message": "PR labeled event handled",
-        "num_files": len(codebase.files),
-        "num_functions": len(codebase.functions)
+        "num_files": num_files,
+        "num_functions": num_functions
     }
 
 @cg.github.event("pull_request:opened")
-def handle_pr_opened(event: PullRequestOpenedEvent):
+async def handle_pr_opened(event: PullRequestOpenedEvent):
     """Handle PR opened events and notify Slack."""
     logger.info("[PR_OPENED] PR opened")
 
-    # Get codebase
+    # Posting the comment and notification is slow, so do it in the background and ACK GitHub now
+    enqueue_work(process_pr_opened, event)
+
+    return {
+        "message": "PR opened event queued",
+        "pr_number": event.pull_request.number,
+        "pr_title": event.pull_request.title
+    }
+
+def process_pr_opened(event: PullRequestOpenedEvent):
+    """Notify Slack about a newly opened PR and post a welcome comment."""
+    # Get codebase; the welcome comment doesn't depend on any checkout
     codebase = cg.get_codebase()
 
     # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set
-    slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+    slack_channel = SLACK_NOTIFY_CHANNEL
     if slack_channel:
-        logger.info(f"> Notifying Slack channel {slack_channel}")
+        logger.info("> Notifying Slack channel %s", slack_channel)
         repo_name = event.repository.full_name
         pr_number = event.pull_request.number
         pr_title = event.pull_request.title
@@ -228,7 +346,7 @@ def handle_pr_opened(event: PullRequestOpenedEvent):
             f"*Description:*\n{pr_body}"
         )
 
-        cg.slack.client.chat_postMessage(channel=slack_channel, text=message)
+        slack_sender.send_threadsafe(slack_channel, message, batchable=True)
 
     # Add a welcome comment to the PR
     welcome_message = "Thanks for opening this PR! :tada:\n\nI'll analyze your changes and provide feedback shortly."
@@ -240,29 +358,38 @@ def handle_pr_opened(event: PullRequestOpenedEvent):
         "pr_title": event.pull_request.title
     }
 
+@cg.github.event("push")
+async def handle_push(event: dict):
+    """Move the agents' codebase to new commits on the default branch."""
+    default_ref = f"refs/heads/{event['repository'].get('default_branch')}"
+    if event.get("ref") != default_ref or event.get("deleted") or not event.get("after"):
+        return {"message": "Push ignored"}
+
+    # Waits for running agents to finish, so do it in the background
+    enqueue_work(codebases.sync_default_branch, event["after"])
+
+    return {"message": "Default branch sync queued"}
+
 @cg.slack.event("message")
 async def handle_message(event: SlackEvent):
     """Handle direct messages to the bot."""
     # Only process messages that are direct messages (DMs)
-    # DM channels typically start with 'D'
-    if not event.channel.startswith('D'):
+    if not is_dm(event):
         return {"message": "Not a DM, ignoring"}
 
     logger.info("[MESSAGE] Received direct message")
 
-    # Get codebase
-    codebase = cg.get_codebase()
+    # Run the agent in the background so Slack gets its ACK right away
+    enqueue_work(reply_with_agent, event)
 
-    # Initialize code agent
-    agent = CodeAgent(codebase=codebase)
+    return {"message": "DM queued"}
 
-    # Run the agent with the message text
-    response = agent.run(event.text)
-
-    # Send response back to Slack
-    cg.slack.client.chat_postMessage(channel=event.channel, text=response, thread_ts=event.ts)
-
-    return {"message": "DM handled", "response": response}
+def format_routes() -> list[str]:
+    """Describe each registered route as "  METHODS path" for the startup log."""
+    return [
+        f"  {','.join(route.methods) if hasattr(route, 'methods') else 'GET'} {route.path}"
+        for route in cg.app.routes
+    ]
 
 ########################################################################################################################
 # LOCAL SERVER STARTUP
@@ -281,22 +408,20 @@ if __name__ == "__main__":
     if not os.environ.get("ANTHROPIC_API_KEY"):
         logger.warning("ANTHROPIC_API_KEY not found in environment. Anthropic API integration may not work correctly.")
 
-    # Run test functions
-    logger.info("Running test functions...")
-    test_results = run_tests()
-    logger.info(f"Test results: {test_results}")
+    # Run test functions in the background; nothing the server handles depends
+    # on them, so don't hold up startup (and Slack's URL verification) for them
+    logger.info("Running test functions in the background...")
+    tests_thread = threading.Thread(
+        target=lambda: logger.info("Test results: %s", run_tests()),
+        daemon=True,
+    )
+    tests_thread.start()
 
     # Log the available routes for debugging
-    logger.info("Available API routes:")
-    for route in cg.app.routes:
-        methods = ','.join(route.methods) if hasattr(route, "methods") else "GET"
-        logger.info(f"  {methods} {route.path}")
-
-    # Get port from environment or use default
-    port = int(os.environ.get("PORT", 8000))
+    logger.info("Available API routes:\n%s", "\n".join(format_routes()))
 
     # Print startup message
-    logger.info(f"Starting CodeGen app on 0.0.0.0:{port}")
+    logger.info("Starting CodeGen app on 0.0.0.0:%s", PORT)
     logger.info("For Slack integration:")
     logger.info("  1. Use ngrok: ngrok http 8000")
     logger.info("  2. Configure Slack Events API URL with: <https://your-ngrok-url/slack/events>")
@@ -304,6 +429,16 @@ if __name__ == "__main__":
     logger.info("  1. Configure GitHub webhook URL with: <https://your-ngrok-url/github/events>")
     logger.info("  2. Set content type to application/json")
 
-    # Run the FastAPI app locally
-    uvicorn.run(cg.app, host="0.0.0.0", port=port, log_level="info")
+    # Run the FastAPI app locally. uvicorn picks uvloop and httptools automatically when they are
+    # installed (fastapi[standard] pulls them in). Keep it to one worker process: the parsed
+    # codebase, the worker pool and Slack event dedupe are per-process. Extra workers would each
+    # re-parse the repository, and a Slack retry that lands on another worker would be handled
+    # twice.
+    uvicorn.run(
+        cg.app,
+        host="0.0.0.0",
+        port=PORT,
+        log_level="info",
+        access_log=False,
+    )
 
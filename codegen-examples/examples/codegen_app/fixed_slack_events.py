@@ -4,24 +4,33 @@ Fixed Slack events handler for the Codegen app.
 This module fixes the issue with Slack events not being properly routed.
 """
 
+import asyncio
 import logging
 import os
-import json
+import threading
+from collections import OrderedDict
+from string import Template
+import orjson
 from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from typing import Dict, Any, Optional
-import threading
-import time
 
 from codegen import CodeAgent, CodegenApp
 from codegen.extensions.github.types.events.pull_request import PullRequestLabeledEvent, PullRequestOpenedEvent
 from codegen.extensions.slack.types import SlackEvent
 from codegen.extensions.tools.github.create_pr_comment import create_pr_comment
 
+from slack_filters import extract_challenge, forget_event_on_error, is_dm, is_duplicate_event
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Settings read once at startup rather than on every event
+SLACK_NOTIFY_CHANNEL = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+PORT = int(os.environ.get("PORT", 8000))
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -33,14 +42,51 @@ logger = logging.getLogger(__name__)
 # Replace with your own repository as needed
 cg = CodegenApp(name="codegen", repo="Zeeeepa/cod")
 
-# Add CORS middleware for local development
-cg.app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # For development only, restrict in production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Serialize handler return values with orjson instead of the stdlib encoder
+cg.app.router.default_response_class = ORJSONResponse
+
+# Every PR event shares cg's one parsed codebase, so a checkout and all the
+# reads that depend on it happen under one lock; otherwise concurrent events
+# could switch the checkout between reading the README and counting files.
+_checkout_lock = threading.Lock()
+
+# What the labeled handler reads at each PR head, keyed by commit SHA. A
+# commit's files never change, so repeated label events on the same head
+# skip the checkout. Only touched under _checkout_lock.
+MAX_CACHED_PR_HEADS = 64
+_pr_head_cache: "OrderedDict[str, tuple[str, int, int]]" = OrderedDict()
+
+def read_pr_head(sha: str) -> tuple[str, int, int]:
+    """Return the README content and file and function counts at commit `sha`."""
+    with _checkout_lock:
+        cached = _pr_head_cache.get(sha)
+        if cached is not None:
+            _pr_head_cache.move_to_end(sha)
+            return cached
+        codebase = cg.get_codebase()
+        current = codebase.current_commit
+        if current is None or current.hexsha != sha:
+            codebase.checkout(commit=sha)
+        cached = _pr_head_cache[sha] = (
+            codebase.get_file("README.md").content,
+            len(codebase.files),
+            len(codebase.functions),
+        )
+        if len(_pr_head_cache) > MAX_CACHED_PR_HEADS:
+            _pr_head_cache.popitem(last=False)
+        return cached
+
+# Add CORS middleware for local development only. Slack and GitHub webhooks
+# are server-to-server and never need it, so by default it stays off the
+# request path; set DEV_CORS=1 to enable it when testing from a browser.
+if os.environ.get("DEV_CORS") == "1":
+    cg.app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
 # Get bot user ID
 def get_bot_user_id():
@@ -49,17 +95,127 @@ def get_bot_user_id():
         response = cg.slack.client.auth_test()
         return response["user_id"]
     except Exception as e:
-        logger.error(f"Error getting bot user ID: {str(e)}")
+        logger.error("Error getting bot user ID: %s", e)
         return None
 
 BOT_USER_ID = get_bot_user_id()
-logger.info(f"Bot User ID: {BOT_USER_ID}")
+logger.info("Bot User ID: %s", BOT_USER_ID)
+
+# Events the bot posted itself carry its ID as the compact "user" field, so
+# they can be dropped by a byte search before the body is parsed
+_BOT_USER_MARKER = f'"user":"{BOT_USER_ID}"'.encode() if BOT_USER_ID else None
+
+# The bot's mention tag, removed from the text of mentions
+_BOT_MENTION_TAG = f"<@{BOT_USER_ID}>" if BOT_USER_ID else None
+
+# Canned replies and responses, built once rather than on every event.
+# Starlette responses aren't modified when sent, so they can be reused.
+APP_MENTION_REPLY = (
+    "👋 Hello! I'm responding to your mention using the fixed event handler. "
+    "Here's what I can do:\n\n"
+    "• Respond to mentions like this one\n"
+    "• Process code-related questions\n"
+    "• Help with GitHub repositories\n\n"
+    "Let me know how I can assist you!"
+)
+DM_REPLY = (
+    "👋 Hello! I'm responding to your direct message using the fixed event handler. "
+    "Here's what I can do:\n\n"
+    "• Answer questions about code\n"
+    "• Help with GitHub repositories\n"
+    "• Provide information about development best practices\n\n"
+    "Let me know how I can assist you!"
+)
+_OK_200 = Response(status_code=200)
+_HEALTH_RESPONSE = ORJSONResponse({"status": "healthy", "app": "codegen-fixed"})
 
 # Add a root endpoint for health checks
 @cg.app.get("/")
 async def health_check():
     """Simple health check endpoint."""
-    return {"status": "healthy", "app": "codegen-fixed"}
+    return _HEALTH_RESPONSE
+
+async def _read_and_parse(request: Request, tag: str) -> tuple[Optional[Response], Optional[Dict[str, Any]]]:
+    """
+    Read and parse a Slack request body.
+    
+    Returns (response, None) when the request can be answered on the spot
+    (URL verification, the bot's own events, invalid JSON, redelivered
+    events), else (None, body).
+    """
+    # Get the request body
+    body_bytes = await request.body()
+    
+    # Answer URL verification and drop the bot's own events before parsing
+    challenge = extract_challenge(body_bytes)
+    if challenge is not None:
+        logger.info("[%s] Handling URL verification challenge", tag)
+        return Response(content=challenge, media_type="text/plain"), None
+    if _BOT_USER_MARKER and _BOT_USER_MARKER in body_bytes:
+        logger.debug("[%s] Ignoring event from the bot itself", tag)
+        return _OK_200, None
+    
+    # Log the raw request for debugging; only the logged slice is decoded
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[%s] Raw request body: %s...", tag, body_bytes[:200].decode('utf-8', 'replace'))
+    
+    try:
+        body = orjson.loads(body_bytes)
+    except orjson.JSONDecodeError:
+        logger.error("[%s] Failed to parse JSON body", tag)
+        return _OK_200, None  # Return 200 to avoid retries
+    
+    # Slack redelivers events it thinks timed out; acknowledge those without handling them again
+    if is_duplicate_event(request, body):
+        return _OK_200, None
+    
+    logger.info("[%s] Request body type: %s", tag, body.get('type', 'unknown'))
+    return None, body
+
+async def _dispatch_slack(request: Request, body: Dict[str, Any], tag: str, handle_manually: bool) -> Response:
+    """
+    Route a parsed Slack payload.
+    
+    URL verification is answered directly. With handle_manually, mentions and
+    DMs go to the manual handlers; everything else goes to cg.slack.
+    """
+    # Handle Slack URL verification challenge
+    if body.get("type") == "url_verification":
+        logger.info("[%s] Handling URL verification challenge", tag)
+        challenge = body.get("challenge")
+        logger.debug("[%s] Returning challenge: %s", tag, challenge)
+
+        # Return the challenge as plaintext as required by Slack
+        return Response(
+            content=challenge,
+            media_type="text/plain"
+        )
+    
+    # Handle Slack events
+    if handle_manually and body.get("type") == "event_callback":
+        logger.info("[%s] Handling Slack event callback", tag)
+        event_data = body.get("event", {})
+        event_type = event_data.get("type")
+        
+        logger.info("[%s] Event type: %s", tag, event_type)
+        
+        # Handle app_mention events
+        if event_type == "app_mention":
+            return await handle_app_mention_manually(event_data)
+        
+        # Handle direct message events
+        if event_type == "message" and is_dm(event_data):
+            return await handle_direct_message_manually(event_data)
+    
+    # Only forward event types that have a cg.slack handler; the rest
+    # (message_changed, reaction_added, ...) are ignored, so just ACK them
+    event_type = body.get("event", {}).get("type")
+    if event_type not in cg.slack.registered_handlers:
+        logger.debug("[%s] No handler for event type %s, acknowledging", tag, event_type)
+        return _OK_200
+    
+    # Process the already-parsed payload through the normal event handlers
+    return await cg.slack.handle(body)
 
 @cg.app.post("/")
 async def root_handler(request: Request):
@@ -70,61 +226,15 @@ async def root_handler(request: Request):
     logger.info("[ROOT] Received POST request")
 
     try:
-        # Get the request body
-        body_bytes = await request.body()
-        body_str = body_bytes.decode('utf-8')
-        
-        # Log the raw request for debugging
-        logger.info(f"[ROOT] Raw request body: {body_str[:200]}...")
-        
-        try:
-            body = json.loads(body_str)
-        except json.JSONDecodeError:
-            logger.error("[ROOT] Failed to parse JSON body")
-            return Response(status_code=200)  # Return 200 to avoid retries
-        
-        logger.info(f"[ROOT] Request body type: {body.get('type', 'unknown')}")
-
-        # Handle Slack URL verification challenge
-        if body.get("type") == "url_verification":
-            logger.info("[ROOT] Handling URL verification challenge")
-            challenge = body.get("challenge")
-            logger.info(f"[ROOT] Returning challenge: {challenge}")
-
-            # Return the challenge as plaintext as required by Slack
-            return Response(
-                content=challenge,
-                media_type="text/plain"
-            )
-        
-        # Handle Slack events
-        if body.get("type") == "event_callback":
-            logger.info("[ROOT] Handling Slack event callback")
-            event_data = body.get("event", {})
-            event_type = event_data.get("type")
-            
-            logger.info(f"[ROOT] Event type: {event_type}")
-            
-            # Handle app_mention events
-            if event_type == "app_mention":
-                return await handle_app_mention_manually(event_data)
-            
-            # Handle direct message events
-            if event_type == "message" and event_data.get("channel_type") == "im":
-                return await handle_direct_message_manually(event_data)
-        
-        # For other types, try to pass to the standard handler
-        try:
-            # Recreate the request with the same body for the standard handler
-            return await cg.slack.handle_webhook(request)
-        except Exception as e:
-            logger.error(f"[ROOT] Error in standard handler: {str(e)}")
-            return Response(status_code=200)  # Return 200 to avoid retries
-
+        response, body = await _read_and_parse(request, "ROOT")
+        if response is not None:
+            return response
+        with forget_event_on_error(body):
+            return await _dispatch_slack(request, body, "ROOT", handle_manually=True)
     except Exception as e:
-        logger.error(f"[ROOT] Error processing request: {str(e)}")
+        logger.error("[ROOT] Error processing request: %s", e)
         # Return a 200 OK response to avoid Slack retrying
-        return Response(status_code=200)
+        return _OK_200
 
 @cg.app.post("/slack/events")
 async def slack_webhook(request: Request):
@@ -135,39 +245,15 @@ async def slack_webhook(request: Request):
     logger.info("[SLACK] Received webhook request at /slack/events")
 
     try:
-        # Get the request body
-        body_bytes = await request.body()
-        body_str = body_bytes.decode('utf-8')
-        
-        # Log the raw request for debugging
-        logger.info(f"[SLACK] Raw request body: {body_str[:200]}...")
-        
-        try:
-            body = json.loads(body_str)
-        except json.JSONDecodeError:
-            logger.error("[SLACK] Failed to parse JSON body")
-            return Response(status_code=200)  # Return 200 to avoid retries
-        
-        logger.info(f"[SLACK] Request body type: {body.get('type', 'unknown')}")
-
-        # Handle Slack URL verification challenge
-        if body.get("type") == "url_verification":
-            logger.info("[SLACK] Handling URL verification challenge")
-            challenge = body.get("challenge")
-            logger.info(f"[SLACK] Returning challenge: {challenge}")
-
-            # Return the challenge as plaintext as required by Slack
-            return Response(
-                content=challenge,
-                media_type="text/plain"
-            )
-
-        # Process the event through the normal event handlers
-        return await cg.slack.handle_webhook(request)
+        response, body = await _read_and_parse(request, "SLACK")
+        if response is not None:
+            return response
+        with forget_event_on_error(body):
+            return await _dispatch_slack(request, body, "SLACK", handle_manually=False)
     except Exception as e:
-        logger.error(f"[SLACK] Error processing webhook: {str(e)}")
+        logger.error("[SLACK] Error processing webhook: %s", e)
         # Return a 200 OK response to avoid Slack retrying
-        return Response(status_code=200)
+        return _OK_200
 
 async def handle_app_mention_manually(event_data):
     """
@@ -185,37 +271,31 @@ async def handle_app_mention_manually(event_data):
     # Skip messages from the bot itself to avoid infinite loops
     if user == BOT_USER_ID:
         logger.info("[APP_MENTION_MANUAL] Ignoring message from the bot itself")
-        return Response(status_code=200)
+        return _OK_200
     
     # Extract the message without the mention
-    message = text.replace(f"<@{BOT_USER_ID}>", "").strip() if BOT_USER_ID else text
+    message = text.replace(_BOT_MENTION_TAG, "").strip() if _BOT_MENTION_TAG else text
     
     # Log the received message
-    logger.info(f"[APP_MENTION_MANUAL] Received message: '{message}' from user {user} in channel {channel}")
+    logger.info("[APP_MENTION_MANUAL] Received message: '%s' from user %s in channel %s", message, user, channel)
     
     # Prepare a response
-    response = (
-        "👋 Hello! I'm responding to your mention using the fixed event handler. "
-        "Here's what I can do:\n\n"
-        "• Respond to mentions like this one\n"
-        "• Process code-related questions\n"
-        "• Help with GitHub repositories\n\n"
-        "Let me know how I can assist you!"
-    )
+    response = APP_MENTION_REPLY
     
     try:
-        # Send the response
-        cg.slack.client.chat_postMessage(
+        # Send the response without blocking the event loop
+        await asyncio.to_thread(
+            cg.slack.client.chat_postMessage,
             channel=channel,
             text=response,
             thread_ts=thread_ts
         )
-        logger.info(f"[APP_MENTION_MANUAL] Sent response to channel {channel}")
+        logger.info("[APP_MENTION_MANUAL] Sent response to channel %s", channel)
         
-        return Response(status_code=200)
+        return _OK_200
     except Exception as e:
-        logger.error(f"[APP_MENTION_MANUAL] Error sending response: {str(e)}")
-        return Response(status_code=200)
+        logger.error("[APP_MENTION_MANUAL] Error sending response: %s", e)
+        return _OK_200
 
 async def handle_direct_message_manually(event_data):
     """
@@ -233,111 +313,115 @@ async def handle_direct_message_manually(event_data):
     # Skip messages from the bot itself to avoid infinite loops
     if user == BOT_USER_ID:
         logger.info("[DM_MANUAL] Ignoring message from the bot itself")
-        return Response(status_code=200)
+        return _OK_200
     
     # Log the received message
-    logger.info(f"[DM_MANUAL] Received message: '{text}' from user {user} in channel {channel}")
+    logger.info("[DM_MANUAL] Received message: '%s' from user %s in channel %s", text, user, channel)
     
     # Prepare a response
-    response = (
-        "👋 Hello! I'm responding to your direct message using the fixed event handler. "
-        "Here's what I can do:\n\n"
-        "• Answer questions about code\n"
-        "• Help with GitHub repositories\n"
-        "• Provide information about development best practices\n\n"
-        "Let me know how I can assist you!"
-    )
+    response = DM_REPLY
     
     try:
-        # Send the response
-        cg.slack.client.chat_postMessage(
+        # Send the response without blocking the event loop
+        await asyncio.to_thread(
+            cg.slack.client.chat_postMessage,
             channel=channel,
             text=response,
             thread_ts=thread_ts
         )
-        logger.info(f"[DM_MANUAL] Sent response to channel {channel}")
+        logger.info("[DM_MANUAL] Sent response to channel %s", channel)
         
-        return Response(status_code=200)
+        return _OK_200
     except Exception as e:
-        logger.error(f"[DM_MANUAL] Error sending response: {str(e)}")
-        return Response(status_code=200)
+        logger.error("[DM_MANUAL] Error sending response: %s", e)
+        return _OK_200
+
+# Slack notification templates for PR events
+PR_LABELED_MESSAGE = Template(
+    "*PR #$pr_number labeled with `$label`*\n"
+    "*Repository:* $repo_name\n"
+    "*Title:* $pr_title\n"
+    "*URL:* $pr_url"
+)
+
+PR_OPENED_MESSAGE = Template(
+    "*New PR #$pr_number opened*\n"
+    "*Repository:* $repo_name\n"
+    "*Title:* $pr_title\n"
+    "*URL:* $pr_url\n\n"
+    "*Description:*\n$pr_body"
+)
+
+# Comment posted on every newly opened PR
+PR_WELCOME_COMMENT = "Thanks for opening this PR! :tada:\n\nI'll analyze your changes and provide feedback shortly."
 
 @cg.github.event("pull_request:labeled")
-def handle_pr_labeled(event: PullRequestLabeledEvent):
+async def handle_pr_labeled(event: PullRequestLabeledEvent):
     """Handle PR labeled events and post a comment with README content."""
     logger.info("[PR_LABELED] PR labeled")
-    logger.info(f"PR head sha: {event.pull_request.head.sha}")
+    logger.info("PR head sha: %s", event.pull_request.head.sha)
 
-    # Get codebase
+    # Check out the PR head and read its README and counts in one go, so they
+    # all come from the same commit (blocking git I/O, so off the event loop)
+    logger.info("> Reading README file at PR head")
+    readme, num_files, num_functions = await asyncio.to_thread(read_pr_head, event.pull_request.head.sha)
     codebase = cg.get_codebase()
 
-    # Checkout commit
-    logger.info("> Checking out commit")
-    codebase.checkout(commit=event.pull_request.head.sha)
-
-    # Get README file
-    logger.info("> Getting README file")
-    file = codebase.get_file("README.md")
-
     # Create PR comment
-    create_pr_comment(codebase, event.pull_request.number, f"File content:\n```markdown\n{file.content}\n```")
+    calls = [asyncio.to_thread(
+        create_pr_comment, codebase, event.pull_request.number, f"File content:\n```markdown\n{readme}\n```"
+    )]
 
     # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set
-    slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+    slack_channel = SLACK_NOTIFY_CHANNEL
     if slack_channel:
-        logger.info(f"> Notifying Slack channel {slack_channel}")
-        repo_name = event.repository.full_name
-        pr_number = event.pull_request.number
-        pr_title = event.pull_request.title
-        pr_url = event.pull_request.html_url
-        label = event.label.name
-
-        message = (
-            f"*PR #{pr_number} labeled with `{label}`*\n"
-            f"*Repository:* {repo_name}\n"
-            f"*Title:* {pr_title}\n"
-            f"*URL:* {pr_url}"
+        logger.info("> Notifying Slack channel %s", slack_channel)
+        message = PR_LABELED_MESSAGE.substitute(
+            pr_number=event.pull_request.number,
+            label=event.label.name,
+            repo_name=event.repository.full_name,
+            pr_title=event.pull_request.title,
+            pr_url=event.pull_request.html_url,
         )
 
-        cg.slack.client.chat_postMessage(channel=slack_channel, text=message)
+        calls.append(asyncio.to_thread(cg.slack.client.chat_postMessage, channel=slack_channel, text=message))
+
+    # The comment and the notification are independent, so send them concurrently
+    await asyncio.gather(*calls)
 
     return {
         "message": "PR labeled event handled",
-        "num_files": len(codebase.files),
-        "num_functions": len(codebase.functions)
+        "num_files": num_files,
+        "num_functions": num_functions
     }
 
 @cg.github.event("pull_request:opened")
-def handle_pr_opened(event: PullRequestOpenedEvent):
+async def handle_pr_opened(event: PullRequestOpenedEvent):
     """Handle PR opened events and notify Slack."""
     logger.info("[PR_OPENED] PR opened")
 
     # Get codebase
-    codebase = cg.get_codebase()
+    codebase = await asyncio.to_thread(cg.get_codebase)
+
+    # Add a welcome comment to the PR
+    calls = [asyncio.to_thread(create_pr_comment, codebase, event.pull_request.number, PR_WELCOME_COMMENT)]
 
     # Notify Slack if SLACK_NOTIFICATION_CHANNEL is set
-    slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+    slack_channel = SLACK_NOTIFY_CHANNEL
     if slack_channel:
-        logger.info(f"> Notifying Slack channel {slack_channel}")
-        repo_name = event.repository.full_name
-        pr_number = event.pull_request.number
-        pr_title = event.pull_request.title
-        pr_url = event.pull_request.html_url
-        pr_body = event.pull_request.body or "No description provided"
-
-        message = (
-            f"*New PR #{pr_number} opened*\n"
-            f"*Repository:* {repo_name}\n"
-            f"*Title:* {pr_title}\n"
-            f"*URL:* {pr_url}\n\n"
-            f"*Description:*\n{pr_body}"
+        logger.info("> Notifying Slack channel %s", slack_channel)
+        message = PR_OPENED_MESSAGE.substitute(
+            pr_number=event.pull_request.number,
+            repo_name=event.repository.full_name,
+            pr_title=event.pull_request.title,
+            pr_url=event.pull_request.html_url,
+            pr_body=event.pull_request.body or "No description provided",
         )
 
-        cg.slack.client.chat_postMessage(channel=slack_channel, text=message)
+        calls.append(asyncio.to_thread(cg.slack.client.chat_postMessage, channel=slack_channel, text=message))
 
-    # Add a welcome comment to the PR
-    welcome_message = "Thanks for opening this PR! :tada:\n\nI'll analyze your changes and provide feedback shortly."
-    create_pr_comment(codebase, event.pull_request.number, welcome_message)
+    # The comment and the notification are independent, so send them concurrently
+    await asyncio.gather(*calls)
 
     return {
         "message": "PR opened event handled",
@@ -345,21 +429,21 @@ def handle_pr_opened(event: PullRequestOpenedEvent):
         "pr_title": event.pull_request.title
     }
 
-def send_slack_startup_message(delay=5):
+async def send_slack_startup_message(delay: float = 5):
     """
     Send a message to Slack after a specified delay.
     
     Args:
-        delay (int): Number of seconds to wait before sending the message.
-                    Default is 5 seconds.
+        delay: Number of seconds to wait before sending the message.
+               Default is 5 seconds.
     """
-    # Wait for the specified delay
+    # Wait for the specified delay without tying up a thread
     if delay > 0:
-        logger.info(f"Waiting {delay} seconds before sending Slack message...")
-        time.sleep(delay)
+        logger.info("Waiting %s seconds before sending Slack message...", delay)
+        await asyncio.sleep(delay)
     
     # Get Slack credentials from environment
-    slack_channel = os.environ.get("SLACK_NOTIFICATION_CHANNEL")
+    slack_channel = SLACK_NOTIFY_CHANNEL
     
     if not slack_channel:
         logger.error("SLACK_NOTIFICATION_CHANNEL not found in environment variables")
@@ -367,16 +451,24 @@ def send_slack_startup_message(delay=5):
     
     try:
         # Send message
-        response = cg.slack.client.chat_postMessage(
+        response = await asyncio.to_thread(
+            cg.slack.client.chat_postMessage,
             channel=slack_channel,
             text="🚀 *Bot Started Successfully!* 🚀\nThe Slack integration is working correctly."
         )
-        logger.info(f"Slack startup message sent successfully: {response['ts']}")
+        logger.info("Slack startup message sent successfully: %s", response['ts'])
         return response
     except Exception as e:
-        logger.error(f"Error sending Slack message: {str(e)}")
+        logger.error("Error sending Slack message: %s", e)
         return None
 
+_startup_message_task: Optional[asyncio.Task] = None
+
+async def schedule_startup_message():
+    """Schedule the Slack startup message on the server's event loop."""
+    global _startup_message_task
+    _startup_message_task = asyncio.create_task(send_slack_startup_message())
+
 ########################################################################################################################
 # LOCAL SERVER STARTUP
 ########################################################################################################################
@@ -394,23 +486,18 @@ if __name__ == "__main__":
     if not os.environ.get("ANTHROPIC_API_KEY"):
         logger.warning("ANTHROPIC_API_KEY not found in environment. Falling back to simple responses.")
 
-    # Send a startup message to Slack
+    # Send a startup message to Slack once the server is up
     logger.info("Sending startup message to Slack...")
-    slack_thread = threading.Thread(target=send_slack_startup_message)
-    slack_thread.daemon = True
-    slack_thread.start()
+    cg.app.add_event_handler("startup", schedule_startup_message)
 
     # Log the available routes for debugging
     logger.info("Available API routes:")
     for route in cg.app.routes:
         methods = ','.join(route.methods) if hasattr(route, "methods") else "GET"
-        logger.info(f"  {methods} {route.path}")
-
-    # Get port from environment or use default
-    port = int(os.environ.get("PORT", 8000))
+        logger.info("  %s %s", methods, route.path)
 
     # Print startup message
-    logger.info(f"Starting Fixed Slack Bot on 0.0.0.0:{port}")
+    logger.info("Starting Fixed Slack Bot on 0.0.0.0:%s", PORT)
     logger.info("For Slack integration:")
     logger.info("  1. Use ngrok: ngrok http 8000")
     logger.info("  2. Configure Slack Events API URL with: <https://your-ngrok-url/>")
@@ -419,5 +506,15 @@ if __name__ == "__main__":
     logger.info("  1. Configure GitHub webhook URL with: <https://your-ngrok-url/github/events>")
     logger.info("  2. Set content type to application/json")
 
-    # Run the FastAPI app locally
-    uvicorn.run(cg.app, host="0.0.0.0", port=port, log_level="info")
\ No newline at end of file
+    # Run the FastAPI app locally. uvicorn picks uvloop and httptools automatically when they are
+    # installed (fastapi[standard] pulls them in). Keep it to one worker process: the parsed
+    # codebase, the PR-head cache and Slack event dedupe are per-process. Extra workers would each
+    # re-parse the repository, and a Slack retry that lands on another worker would be handled
+    # twice.
+    uvicorn.run(
+        cg.app,
+        host="0.0.0.0",
+        port=PORT,
+        log_level="info",
+        access_log=False,
+    )
\ No newline at end of file
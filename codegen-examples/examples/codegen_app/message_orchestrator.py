@@ -26,6 +26,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Event fields the orchestrator and flow handlers read
+_EVENT_FIELDS = ("type", "text", "user", "channel", "channel_type", "ts", "thread_ts", "team", "bot_id")
+
 
 class MessageType(Enum):
     """Types of messages that can be sent or received."""
@@ -336,16 +339,25 @@ class MessageOrchestrator:
         
         return flow
     
-    def handle_event(self, event: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_event(self, event: Union[Dict[str, Any], Any]) -> Dict[str, Any]:
         """
         Handle a Slack event and route it to the appropriate flow.
         
         Args:
-            event: The Slack event data
+            event: The Slack event data, either the raw event dict or an event
+                object (e.g. codegen's SlackEvent) with the same attribute names
             
         Returns:
             A dictionary with information about the handled event
         """
+        # Copy just the fields we use off event objects rather than their whole __dict__
+        if not isinstance(event, dict):
+            event = {
+                name: value
+                for name in _EVENT_FIELDS
+                if (value := getattr(event, name, None)) is not None
+            }
+        
         # Extract event type
         event_type = event.get("type")
         
@@ -569,11 +569,8 @@ async def handle_mention(event: SlackEvent):
     """Handle mentions in Slack using the MessageOrchestrator."""
     logger.info("[APP_MENTION] Received app_mention event")
     
-    # Convert the SlackEvent to a dictionary
-    event_dict = event.__dict__
-    
     # Use the orchestrator to handle the event
-    result = orchestrator.handle_event(event_dict)
+    result = orchestrator.handle_event(event)
     
     logger.info(f"[APP_MENTION] Orchestrator result: {result}")
     
@@ -589,11 +586,8 @@ async def handle_message(event: SlackEvent):
 
     logger.info("[MESSAGE] Received direct message")
     
-    # Convert the SlackEvent to a dictionary
-    event_dict = event.__dict__
-    
     # Use the orchestrator to handle the event
-    result = orchestrator.handle_event(event_dict)
+    result = orchestrator.handle_event(event)
     
     logger.info(f"[MESSAGE] Orchestrator result: {result}")
     
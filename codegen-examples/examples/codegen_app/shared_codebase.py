@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+One parsed codebase shared by agents and PR handlers.
+
+Agents can run for minutes, so they must neither wait on each other nor see
+the tree move under them. PR handlers only need a few quick reads at a PR
+head. SharedCodebase keeps the two apart:
+- Agents lease the app's codebase, which stays on the default branch. Any
+  number of leases can be held at once.
+- A push to the default branch moves that codebase once the running agents
+  have finished. New leases wait for the move.
+- PR heads are read through a second clone of the repository, checked out
+  under its own lock. A PR checkout never waits for an agent.
+"""
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from codegen import Codebase
+from codegen.configs.models.codebase import CodebaseConfig
+from codegen.configs.models.secrets import SecretsConfig
+
+logger = logging.getLogger(__name__)
+
+def current_sha(codebase: Codebase) -> Optional[str]:
+    """The commit the codebase is checked out at, if any."""
+    commit = codebase.current_commit
+    return commit.hexsha if commit is not None else None
+
+class SharedCodebase:
+    """Default-branch leases for agents and short PR-head checkouts for handlers."""
+
+    def __init__(self, get_codebase: Callable[[], Codebase], repo: str, tmp_dir: str):
+        """
+        Args:
+            get_codebase: Returns the app's parsed codebase, parsing it if needed
+            repo: Repository name in format "owner/repo", cloned again for PR heads
+            tmp_dir: Directory for the PR-head clone; must differ from the app's
+        """
+        self._get_codebase = get_codebase
+        self._repo = repo
+        self._tmp_dir = tmp_dir
+
+        self._state = threading.Condition()
+        self._leases = 0
+        self._syncing = False
+
+        self._head_lock = threading.Lock()
+        self._head_codebase: Optional[Codebase] = None
+
+    @contextmanager
+    def default_branch(self) -> Iterator[Codebase]:
+        """Yield the app's codebase; it stays on its commit until the block exits."""
+        with self._state:
+            self._state.wait_for(lambda: not self._syncing)
+            self._leases += 1
+        try:
+            yield self._get_codebase()
+        finally:
+            with self._state:
+                self._leases -= 1
+                self._state.notify_all()
+
+    def sync_default_branch(self, sha: str) -> None:
+        """Check the app's codebase out at a new default-branch commit once no agent holds it."""
+        with self._state:
+            self._state.wait_for(lambda: not self._syncing)
+            self._syncing = True
+            self._state.wait_for(lambda: self._leases == 0)
+        try:
+            codebase = self._get_codebase()
+            if current_sha(codebase) != sha:
+                logger.info("[CODEBASE] Syncing default branch to %s", sha)
+                codebase.checkout(commit=sha)
+        finally:
+            with self._state:
+                self._syncing = False
+                self._state.notify_all()
+
+    @contextmanager
+    def at_commit(self, sha: str) -> Iterator[Codebase]:
+        """
+        Yield a codebase checked out at `sha`.
+
+        Other PR reads wait until the block exits, so copy out what you need
+        and do slow work (agent runs, API calls) after it.
+        """
+        with self._head_lock:
+            if self._head_codebase is None:
+                logger.info("[CODEBASE] Cloning %s for PR heads", self._repo)
+                self._head_codebase = Codebase.from_repo(
+                    repo_full_name=self._repo,
+                    tmp_dir=self._tmp_dir,
+                    commit=sha,
+                    config=CodebaseConfig(sync_enabled=True),
+                    secrets=SecretsConfig(github_token=os.environ.get("GITHUB_ACCESS_TOKEN")),
+                )
+            elif current_sha(self._head_codebase) != sha:
+                self._head_codebase.checkout(commit=sha)
+            yield self._head_codebase
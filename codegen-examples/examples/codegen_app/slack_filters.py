@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Shared screening for incoming Slack webhooks.
+
+Every app answers URL verification, tells DMs apart from channel messages and
+drops events Slack delivers more than once. This module holds the one
+implementation of each so the apps can't drift apart.
+"""
+
+import logging
+import re
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+# Slack's URL verification payload is tiny and fixed-shape, so the challenge
+# can be answered straight from the raw bytes without parsing JSON
+MAX_VERIFICATION_BODY = 2048
+_URL_VERIFICATION_RE = re.compile(rb'"type"\s*:\s*"url_verification"')
+_CHALLENGE_RE = re.compile(rb'"challenge"\s*:\s*"([^"\\]*)"')
+
+def extract_challenge(body_bytes: bytes) -> Optional[str]:
+    """Return the challenge from a URL verification body, or None if it isn't a simple one."""
+    if len(body_bytes) > MAX_VERIFICATION_BODY or not _URL_VERIFICATION_RE.search(body_bytes):
+        return None
+    match = _CHALLENGE_RE.search(body_bytes)
+    return match.group(1).decode() if match else None
+
+def is_dm(event: Any) -> bool:
+    """
+    Whether a Slack event happened in a direct message.
+
+    Accepts a raw event dict or a parsed event object. Slack marks DMs with
+    channel_type "im" on raw events; parsed SlackEvents drop that field, so
+    they fall back to DM channel IDs starting with "D".
+    """
+    if isinstance(event, dict):
+        channel_type, channel = event.get("channel_type"), event.get("channel")
+    else:
+        channel_type, channel = getattr(event, "channel_type", None), getattr(event, "channel", None)
+    if channel_type is not None:
+        return channel_type == "im"
+    return isinstance(channel, str) and channel.startswith("D")
+
+def is_channel_message(event_data: Dict[str, Any]) -> bool:
+    """Whether a raw Slack event is a message outside a DM, which the bots ignore."""
+    return event_data.get("type") == "message" and not is_dm(event_data)
+
+# Slack event IDs that were handled or are being handled, oldest first, so
+# redelivered events are acknowledged without running their handlers a second
+# time. IDs whose handling fails are removed again by forget_event_on_error.
+MAX_SEEN_EVENT_IDS = 4096
+_seen_event_ids: "OrderedDict[str, None]" = OrderedDict()
+
+def is_duplicate_event(request: Request, body: Dict[str, Any]) -> bool:
+    """
+    Record the body's event_id and report whether it was already seen.
+
+    Wrap the dispatch that follows in forget_event_on_error, so a retry of an
+    event whose handling failed isn't dropped as a duplicate.
+    """
+    event_id = body.get("event_id")
+    if not event_id:
+        return False
+    if event_id in _seen_event_ids:
+        logger.info(
+            "[SLACK] Skipping duplicate event %s (retry %s)",
+            event_id, request.headers.get("X-Slack-Retry-Num", "0"),
+        )
+        return True
+    _seen_event_ids[event_id] = None
+    if len(_seen_event_ids) > MAX_SEEN_EVENT_IDS:
+        _seen_event_ids.popitem(last=False)
+    return False
+
+@contextmanager
+def forget_event_on_error(body: Dict[str, Any]) -> Iterator[None]:
+    """Drop the body's event_id from the seen set if the block raises."""
+    try:
+        yield
+    except BaseException:
+        event_id = body.get("event_id")
+        if event_id:
+            _seen_event_ids.pop(event_id, None)
+        raise
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Rate-limited Slack sender for the Codegen apps.
+
+Slack allows roughly one chat.postMessage per second per channel. This module
+queues outgoing messages per channel, coalesces bursts of batchable
+notifications into a single post and backs off on HTTP 429 responses using the
+Retry-After header.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+logger = logging.getLogger(__name__)
+
+class SlackSender:
+    """
+    Sends Slack messages through one queue and consumer task per channel.
+
+    Posts to a channel are spaced at least `min_interval` seconds apart. A
+    message is posted as soon as that allows, without waiting for more. Only
+    messages sent with `batchable=True` are merged: consecutive ones to the
+    same thread that queue up while the channel is rate limited (up to
+    `max_batch` of them) are joined into a single post.
+    """
+
+    def __init__(self, client: WebClient, max_batch: int = 20, min_interval: float = 1.0):
+        """
+        Initialize the sender.
+
+        Args:
+            client: The Slack WebClient instance
+            max_batch: Maximum number of messages coalesced into one post
+            min_interval: Minimum seconds between posts to the same channel
+        """
+        self.client = client
+        self.max_batch = max_batch
+        self.min_interval = min_interval
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._consumers: Dict[str, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        """Bind the sender to the running event loop so worker threads can use it."""
+        self._loop = asyncio.get_running_loop()
+
+    async def send(self, channel: str, text: str, thread_ts: Optional[str] = None, batchable: bool = False):
+        """
+        Queue a message for `channel`, optionally as a reply in `thread_ts`.
+
+        Set `batchable` for self-contained notifications that may share a post
+        with other batchable messages to the same thread.
+        """
+        self._loop = asyncio.get_running_loop()
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = asyncio.Queue()
+            self._consumers[channel] = asyncio.create_task(self._consume(channel, queue))
+        queue.put_nowait((text, thread_ts, batchable))
+
+    def send_threadsafe(self, channel: str, text: str, thread_ts: Optional[str] = None, batchable: bool = False):
+        """
+        Queue a message from a worker thread.
+
+        Falls back to posting directly if the sender hasn't been started on an
+        event loop yet (e.g. before the server is up).
+        """
+        if self._loop is None or self._loop.is_closed():
+            self.client.chat_postMessage(channel=channel, text=text, thread_ts=thread_ts)
+            return
+        asyncio.run_coroutine_threadsafe(self.send(channel, text, thread_ts, batchable), self._loop)
+
+    async def _consume(self, channel: str, queue: asyncio.Queue):
+        """Post a channel's messages in order, at most one post per `min_interval`."""
+        last_send = 0.0
+        pending: Optional[Tuple[str, Optional[str], bool]] = None
+        while True:
+            text, thread_ts, batchable = pending or await queue.get()
+            pending = None
+            await asyncio.sleep(max(0.0, self.min_interval - (time.monotonic() - last_send)))
+
+            # Fold in batchable messages for the same thread that queued up while we waited;
+            # the first message that can't join is held back for the next post
+            texts = [text]
+            while batchable and len(texts) < self.max_batch and not queue.empty():
+                item = queue.get_nowait()
+                if item[2] and item[1] == thread_ts:
+                    texts.append(item[0])
+                else:
+                    pending = item
+                    break
+
+            await self._post(channel, "\n---\n".join(texts), thread_ts)
+            last_send = time.monotonic()
+            for _ in texts:
+                queue.task_done()
+
+    async def _post(self, channel: str, text: str, thread_ts: Optional[str], max_retries: int = 5):
+        """Post one message, sleeping for Retry-After (or backing off) on 429s."""
+        for attempt in range(max_retries):
+            try:
+                await asyncio.to_thread(self.client.chat_postMessage, channel=channel, text=text, thread_ts=thread_ts)
+                return
+            except SlackApiError as e:
+                if e.response.status_code != 429:
+                    logger.error("[SLACK_SENDER] Error posting to %s: %s", channel, e.response["error"])
+                    return
+                retry_after = float(e.response.headers.get("Retry-After", 2 ** attempt))
+                logger.warning("[SLACK_SENDER] Rate limited on %s, retrying in %.0fs", channel, retry_after)
+                await asyncio.sleep(retry_after)
+            except Exception as e:
+                logger.error("[SLACK_SENDER] Error posting to %s: %s", channel, e)
+                return
+        logger.error("[SLACK_SENDER] Giving up on message to %s after %d attempts", channel, max_retries)
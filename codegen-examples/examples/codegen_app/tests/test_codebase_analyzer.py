@@ -0,0 +1,98 @@
+"""Tests for the codebase analyzer."""
+
+from codegen.sdk.codebase.factory.get_session import get_codebase_session
+
+from codebase_analyzer import AnalysisType, CodebaseAnalyzer
+
+
+def test_component_interaction_follows_imports(tmpdir):
+    files = {
+        "app/main.py": "from lib.util import helper\n\ndef main():\n    return helper()\n",
+        "app/config.py": "DEBUG = True\n",
+        "lib/util.py": "from app.config import DEBUG\n\ndef helper():\n    return DEBUG\n",
+        "lib/extra.py": "def extra():\n    pass\n",
+    }
+    with get_codebase_session(tmpdir=tmpdir, files=files) as codebase:
+        analyzer = CodebaseAnalyzer(codebase)
+        result = analyzer.analyze(AnalysisType.COMPONENT_INTERACTION)
+
+    assert result.details["interactions"] == {"app": {"lib": 1}, "lib": {"app": 1}}
+    assert result.metrics["interaction_count"] == 2
+
+
+def test_cyclomatic_complexity_scores_each_function_separately(tmpdir):
+    content = """
+class A:
+    def run(self, x):
+        if x:
+            return 1
+
+class B:
+    def run(self, x):
+        def inner(y):
+            if y and x:
+                return 2
+        return inner
+"""
+    with get_codebase_session(tmpdir=tmpdir, files={"mod.py": content}) as codebase:
+        analyzer = CodebaseAnalyzer(codebase)
+        result = analyzer.analyze(AnalysisType.CYCLOMATIC_COMPLEXITY)
+
+    assert result.details["complexities"] == {
+        "mod.py:A.run": 2,
+        "mod.py:B.run": 1,
+        "mod.py:B.run.<locals>.inner": 3,
+    }
+
+
+def test_cyclomatic_complexity_counts_loop_else_and_comprehension_ifs(tmpdir):
+    content = """
+def f(xs):
+    for x in xs:
+        pass
+    else:
+        pass
+    while xs:
+        break
+    else:
+        pass
+    return [x for x in xs if x if x > 1]
+"""
+    with get_codebase_session(tmpdir=tmpdir, files={"mod.py": content}) as codebase:
+        analyzer = CodebaseAnalyzer(codebase)
+        result = analyzer.analyze(AnalysisType.CYCLOMATIC_COMPLEXITY)
+
+    # 1 + for/else 2 + while/else 2 + comprehension with two ifs 3, as radon scores it
+    assert result.details["complexities"] == {"mod.py:f": 8}
+
+
+def test_invalidate_picks_up_edited_files(tmpdir):
+    with get_codebase_session(tmpdir=tmpdir, files={"mod.py": "def f(x):\n    return x\n"}) as codebase:
+        analyzer = CodebaseAnalyzer(codebase)
+        before = analyzer.analyze(AnalysisType.CYCLOMATIC_COMPLEXITY)
+        assert before.details["complexities"] == {"mod.py:f": 1}
+
+        codebase.get_file("mod.py").edit("def f(x):\n    if x:\n        return x\n    return 0\n")
+        codebase.commit()
+        analyzer.invalidate(["mod.py"])
+        after = analyzer.analyze(AnalysisType.CYCLOMATIC_COMPLEXITY)
+
+    assert after.details["complexities"] == {"mod.py:f": 2}
+
+
+def test_invalidate_drops_dependencies_of_importers(tmpdir):
+    files = {
+        "a.py": "from b import helper\n\ndef run():\n    return helper()\n",
+        "b.py": "def other():\n    pass\n",
+        "c.py": "def standalone():\n    pass\n",
+    }
+    with get_codebase_session(tmpdir=tmpdir, files=files) as codebase:
+        analyzer = CodebaseAnalyzer(codebase)
+        analyzer._dep_cache = {("run", "a.py"): (), ("standalone", "c.py"): ()}
+
+        # b.py starts defining the name a.py imports, so a.py's lookups are stale
+        codebase.get_file("b.py").edit("def other():\n    pass\n\ndef helper():\n    return 1\n")
+        codebase.commit()
+        analyzer.invalidate(["b.py"])
+
+    assert analyzer._dep_cache == {("standalone", "c.py"): ()}
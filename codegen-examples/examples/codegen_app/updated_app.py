@@ -1,3 +1,4 @@
+import functools
 import logging
 import os
 
@@ -160,24 +161,27 @@ async def handle_message(event: SlackEvent):
 REPO_URL = "https://github.com/codegen-sh/codegen-sdk.git"
 COMMIT_ID = "6a0e101718c247c01399c60b7abf301278a41786"
 
-# Create the base image with dependencies
-base_image = (
-    modal.Image.debian_slim(python_version="3.13")
-    .apt_install("git")
-    .pip_install(
-        # =====[ Codegen ]=====
-        # "codegen",
-        f"git+{REPO_URL}@{COMMIT_ID}",
-        # =====[ Rest ]=====
-        "openai>=1.1.0",
-        "fastapi[standard]",
-        "slack_sdk",
+@functools.cache
+def _base_image() -> modal.Image:
+    """Build the base image with dependencies, at most once per process."""
+    return (
+        modal.Image.debian_slim(python_version="3.13")
+        .apt_install("git")
+        .pip_install(
+            # =====[ Codegen ]=====
+            # "codegen",
+            f"git+{REPO_URL}@{COMMIT_ID}",
+            # =====[ Rest ]=====
+            # Pinned so Modal can reuse the cached image layer across deploys
+            "openai==1.66.3",
+            "fastapi[standard]==0.115.11",
+            "slack_sdk==3.34.0",
+        )
     )
-)
 
 app = modal.App("codegen-test")
 
-@app.function(image=base_image, secrets=[modal.Secret.from_dotenv()])
+@app.function(image=_base_image(), secrets=[modal.Secret.from_dotenv()])
 @modal.asgi_app()
 def fastapi_app():
     print("Starting codegen fastapi app")